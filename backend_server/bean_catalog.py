@@ -0,0 +1,228 @@
+"""
+コーヒー豆一覧（カタログ）のキャッシュとページング
+/beans, /user-beans, /user-beans/{user_id} で共有し、TTLの間はDBに問い合わせない
+カタログの内容から作るバージョン（ETag）で、変更が無ければ 304 を返せるようにする
+
+limit/after を指定した場合はキャッシュを使わず、(豆名, id) のキーセットページングで
+必要な行だけをDBから取得する（カタログの大きさに関係なくメモリ使用量は一定）
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+import mysql.connector
+
+# カタログを再読み込みするまでの秒数
+BEAN_CATALOG_TTL = float(os.getenv('BEAN_CATALOG_TTL', '30'))
+
+# ページングの最大件数
+MAX_PAGE_SIZE = 1000
+
+# ストリーミング時にDBから一度に読む行数
+STREAM_FETCH_SIZE = 500
+
+BEAN_LIST_QUERY = """
+SELECT b.id, b.name, b.from_location, u.name as user_name, b.user_id
+FROM beans b
+JOIN users u ON b.user_id = u.id
+"""
+
+
+class BeanCatalog:
+    """ある時点のカタログ（読み取り専用）"""
+
+    def __init__(self, beans, loaded_at):
+        self.beans = beans              # [{'id', 'name', 'origin', 'user_name', 'user_id'}] 豆名順
+        self.loaded_at = loaded_at
+        self.version = hashlib.sha1(
+            json.dumps(beans, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, user_id=None):
+        """レスポンス用のJSON（ユーザーごとに一度だけ作成）"""
+        with self._lock:
+            body = self._encoded.get(user_id)
+            if body is None:
+                beans = [
+                    {'id': b['id'], 'name': b['name'], 'origin': b['origin'], 'user_name': b['user_name']}
+                    for b in self.beans
+                    if user_id is None or b['user_id'] == user_id
+                ]
+                body = json.dumps(beans, ensure_ascii=False).encode('utf-8')
+                self._encoded[user_id] = body
+            return body
+
+
+class BeanCatalogCache:
+    """カタログのキャッシュ（TTL経過後または invalidate() 後の最初の読み取りで再読み込み）"""
+
+    QUERY = BEAN_LIST_QUERY + "ORDER BY b.name, b.id"
+
+    def __init__(self, mysql_config, ttl=BEAN_CATALOG_TTL):
+        self.mysql_config = mysql_config
+        self.ttl = ttl
+        self._catalog = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.reloads = 0
+
+    def get(self):
+        """現在のカタログを取得"""
+        catalog = self._catalog
+        if catalog is not None and time.time() - catalog.loaded_at < self.ttl:
+            self.hits += 1
+            return catalog
+
+        with self._lock:
+            # 他のリクエストが読み込み済みならそれを使う
+            catalog = self._catalog
+            if catalog is not None and time.time() - catalog.loaded_at < self.ttl:
+                self.hits += 1
+                return catalog
+
+            connection = mysql.connector.connect(**self.mysql_config)
+            cursor = connection.cursor()
+            try:
+                cursor.execute(self.QUERY)
+                beans = [
+                    {'id': row[0], 'name': row[1], 'origin': row[2], 'user_name': row[3], 'user_id': row[4]}
+                    for row in cursor.fetchall()
+                ]
+            finally:
+                cursor.close()
+                connection.close()
+
+            catalog = BeanCatalog(beans, time.time())
+            if self._catalog is None or self._catalog.version != catalog.version:
+                print(f"豆カタログを更新しました: {len(beans)}件 (version={catalog.version})")
+            self._catalog = catalog
+            self.reloads += 1
+            return catalog
+
+    def invalidate(self):
+        """キャッシュを破棄（次の読み取りでDBから再読み込み）"""
+        with self._lock:
+            self._catalog = None
+
+    def stats(self):
+        """キャッシュの統計情報"""
+        catalog = self._catalog
+        return {
+            "version": catalog.version if catalog else None,
+            "bean_count": len(catalog.beans) if catalog else 0,
+            "age_seconds": time.time() - catalog.loaded_at if catalog else None,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "reloads": self.reloads
+        }
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match ヘッダーが ETag と一致するか（弱いETag・複数指定にも対応）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def encode_cursor(name, bean_id):
+    """ページングカーソルを作成（最後に返した豆の (豆名, id)）"""
+    raw = json.dumps([name, bean_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """ページングカーソルを (豆名, id) に戻す（不正な場合は ValueError）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        name, bean_id = json.loads(raw.decode('utf-8'))
+        return str(name), int(bean_id)
+    except Exception:
+        raise ValueError(f"不正なカーソルです: {cursor}")
+
+
+def _keyset_query(user_id, after, limit):
+    """(豆名, id) 順のキーセットページング用クエリを作成"""
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append("b.user_id = %s")
+        params.append(user_id)
+    if after is not None:
+        name, bean_id = after
+        conditions.append("(b.name > %s OR (b.name = %s AND b.id > %s))")
+        params.extend([name, name, bean_id])
+
+    query = BEAN_LIST_QUERY
+    if conditions:
+        query += "WHERE " + " AND ".join(conditions) + "\n"
+    query += "ORDER BY b.name, b.id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, tuple(params)
+
+
+def _row_to_bean(row):
+    return {'id': row[0], 'name': row[1], 'origin': row[2], 'user_name': row[3]}
+
+
+def fetch_bean_page(mysql_config, user_id=None, after=None, limit=100):
+    """
+    豆一覧の1ページを取得
+
+    Returns:
+        tuple: (豆のリスト, 次ページのカーソル。最後のページならNone)
+    """
+    query, params = _keyset_query(user_id, after, limit + 1)
+
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        connection.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return [_row_to_bean(row) for row in rows], next_cursor
+
+
+def stream_beans(mysql_config, user_id=None, after=None, limit=None):
+    """
+    豆一覧をNDJSON（1行1件）で順次出力するジェネレータ
+    サーバー側カーソル（バッファなし）から STREAM_FETCH_SIZE 件ずつ読み出す
+    """
+    query, params = _keyset_query(user_id, after, limit)
+
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            yield ''.join(
+                json.dumps(_row_to_bean(row), ensure_ascii=False) + '\n' for row in rows
+            ).encode('utf-8')
+    finally:
+        # クライアントが途中で切断した場合は未読の行が残っているため、エラーは無視して接続を閉じる
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+        connection.close()
@@ -0,0 +1,303 @@
+"""
+レシピの追加を検出して、変更された豆だけを再学習・オンライン更新するバックグラウンドジョブ
+
+CHANGE_POLLER_INTERVAL_SECONDS ごとに「前回確認した recipe.id より大きい行」を豆ごとに集計する1回のクエリを実行する。
+recipe.id は主キーなので、このクエリは新しい行だけを範囲で読み、テーブル全体の件数には依存しない。
+（recipe に更新日時の列は無いため、検出するのは追加された行のみ）
+
+変更された豆ごとに、まだ反映していない行数がたまったら:
+    CHANGE_POLLER_RETRAIN_ROWS 行以上、または豆のモデルが無い場合   → 再学習
+    それ未満で、豆のモデルがありオンライン更新が有効な場合           → 新しい行だけでオンライン更新
+                                                                    （/online-update で学習済みの行は学習しない: online_model.py）
+    CHANGE_POLLER_MIN_ROWS 行未満                                   → 次の確認まで待つ
+
+新しい行の日付の特徴量は、検出した時点で recipe_features に保存する（materialize: feature_store.py）。
+
+複数のワーカーで起動しても、ファイルロックを取得した1つのワーカーだけが確認する
+（そのワーカーが終了するとロックが解放され、別のワーカーが引き継ぐ）。
+確認済みの位置と豆ごとの未反映の行数は CHANGE_POLLER_STATE_FILE に保存し、再起動後も続きから確認する。
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import mysql.connector
+
+from features import RECIPE_COLUMNS
+
+# 確認するかどうか（true / false）
+CHANGE_POLLER_ENABLED = os.getenv('CHANGE_POLLER_ENABLED', 'true').lower() == 'true'
+
+# 確認する間隔（秒）
+CHANGE_POLLER_INTERVAL_SECONDS = float(os.getenv('CHANGE_POLLER_INTERVAL_SECONDS', '30'))
+
+# この行数以上たまった豆を反映する
+CHANGE_POLLER_MIN_ROWS = int(os.getenv('CHANGE_POLLER_MIN_ROWS', '1'))
+
+# この行数以上たまった豆はオンライン更新ではなく再学習する
+CHANGE_POLLER_RETRAIN_ROWS = int(os.getenv('CHANGE_POLLER_RETRAIN_ROWS', '20'))
+
+CHANGE_POLLER_STATE_FILE = os.getenv('CHANGE_POLLER_STATE_FILE', 'model/change_poller.json')
+CHANGE_POLLER_LOCK_FILE = os.getenv('CHANGE_POLLER_LOCK_FILE', 'model/change_poller.lock')
+
+# 前回確認した位置より後に追加された行を豆ごとに集計（主キーの範囲だけを読む）
+CHANGED_BEANS_QUERY = """
+SELECT b.name, COUNT(*), MAX(r.id)
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+WHERE r.id > %s
+GROUP BY b.name
+"""
+
+# 初回起動時の確認位置（既存の行は反映済みとみなす）
+MAX_RECIPE_ID_QUERY = "SELECT MAX(id) FROM recipe"
+
+# オンライン更新に使う、豆の未反映の行
+PENDING_ROWS_QUERY = """
+SELECT r.id, r.gram, r.mesh, r.extraction_time, r.date, r.weather, r.temperature, r.humidity, r.days_passed,
+       b.name, b.from_location
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+WHERE b.name = %s AND r.id > %s AND r.id <= %s
+ORDER BY r.id
+"""
+
+# /online-update で指定された保存済みのレシピ（列は PENDING_ROWS_QUERY と同じ）
+RECIPE_BY_ID_QUERY = """
+SELECT r.id, r.gram, r.mesh, r.extraction_time, r.date, r.weather, r.temperature, r.humidity, r.days_passed,
+       b.name, b.from_location
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+WHERE r.id = %s
+"""
+
+
+def recipe_updates(rows):
+    """
+    PENDING_ROWS_QUERY の行をオンライン更新の入力にする
+
+    Returns:
+        tuple: (recipe.id のリスト, 入力のリスト, 実測値のリスト)
+    """
+    recipe_ids, records, targets = [], [], []
+    for row in rows:
+        recipe = dict(zip(RECIPE_COLUMNS, row[1:1 + len(RECIPE_COLUMNS)]))
+        bean_name, bean_origin = row[1 + len(RECIPE_COLUMNS):]
+        recipe_ids.append(row[0])
+        records.append({
+            'bean_name': bean_name,
+            'bean_origin': bean_origin,
+            'date': str(recipe['date'])[:10],
+            'weather': recipe['weather'],
+            'temperature': recipe['temperature'],
+            'humidity': recipe['humidity'],
+            'days_passed': recipe['days_passed']
+        })
+        targets.append([recipe['mesh'], recipe['gram'], recipe['extraction_time']])
+    return recipe_ids, records, targets
+
+
+def fetch_recipe_update(mysql_config, recipe_id):
+    """
+    保存済みのレシピ1件をオンライン更新の入力にする
+
+    Returns:
+        tuple: (豆名, recipe.id のリスト, 入力のリスト, 実測値のリスト)。レシピが無い場合はNone
+    """
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(RECIPE_BY_ID_QUERY, (recipe_id,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        connection.close()
+    if not rows:
+        return None
+    return (rows[0][-2],) + recipe_updates(rows)
+
+
+class ChangePoller:
+    """レシピの追加の確認と、変更された豆の再学習・オンライン更新"""
+
+    def __init__(self, mysql_config, has_model, retrain, update=None, materialize=None,
+                 interval=CHANGE_POLLER_INTERVAL_SECONDS, min_rows=CHANGE_POLLER_MIN_ROWS,
+                 retrain_rows=CHANGE_POLLER_RETRAIN_ROWS,
+                 state_path=CHANGE_POLLER_STATE_FILE, lock_path=CHANGE_POLLER_LOCK_FILE):
+        """
+        Args:
+            has_model: 豆名 -> 豆のモデルがあるかどうか
+            retrain: 豆名 -> 再学習する関数
+            update: (豆名, recipe.id のリスト, 入力のリスト, 実測値のリスト) -> オンライン更新する関数（Noneの場合は常に再学習）
+            materialize: (確認済みの最大ID, 新しい最大ID) -> 新しい行の特徴量を保存する関数
+        """
+        self.mysql_config = mysql_config
+        self.has_model = has_model
+        self.retrain = retrain
+        self.update = update
+        self.materialize = materialize
+        self.interval = interval
+        self.min_rows = min_rows
+        self.retrain_rows = retrain_rows
+        self.state_path = state_path
+        self.lock_path = lock_path
+
+        self.watermark = None           # 確認済みの最大 recipe.id
+        self.pending = {}               # 豆名 -> {'rows': 未反映の行数, 'since': 反映済みの最大ID, 'until': 確認済みの最大ID}
+        self.polls = 0
+        self.retrained = 0
+        self.updated = 0
+        self.last_error = None
+        self._lock_file = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.watermark = state.get('watermark')
+            self.pending = state.get('pending', {})
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"変更確認の状態ファイルを読み込めません（現在の位置から確認します）: {e}")
+
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'watermark': self.watermark,
+                'pending': self.pending,
+                'updated_at': datetime.now().isoformat()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def is_leader(self):
+        """確認を担当するワーカーかどうか（ロックを取得できればこのワーカーが担当）"""
+        if self._lock_file is not None:
+            return True
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        # 担当が変わった場合は前の担当が保存した位置から続ける
+        self._load_state()
+        print(f"レシピの変更確認を開始します (pid={os.getpid()}, 確認済みID: {self.watermark})")
+        return True
+
+    def _query(self, query, params=()):
+        connection = mysql.connector.connect(**self.mysql_config)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def poll(self):
+        """
+        追加された行を確認して、たまった豆を反映
+
+        Returns:
+            dict: 豆名 -> 'retrain' / 'update'（反映した豆のみ）
+        """
+        self.polls += 1
+        if self.watermark is None:
+            self.watermark = self._query(MAX_RECIPE_ID_QUERY)[0][0] or 0
+            self._save_state()
+            return {}
+
+        rows = self._query(CHANGED_BEANS_QUERY, (self.watermark,))
+        if rows:
+            for bean_name, count, max_id in rows:
+                entry = self.pending.setdefault(bean_name, {'rows': 0, 'since': self.watermark})
+                entry['rows'] += int(count)
+                entry['until'] = max_id
+            latest = max(max_id for _, _, max_id in rows)
+            if self.materialize is not None:
+                try:
+                    self.materialize(self.watermark, latest)
+                except Exception as e:
+                    # 保存できなかった行の特徴量は学習時に計算される（feature_store.py backfill で後から保存できる）
+                    print(f"新しい行の特徴量を保存できません: {e}")
+            self.watermark = latest
+            self._save_state()
+
+        actions = {}
+        for bean_name, entry in list(self.pending.items()):
+            if entry['rows'] < self.min_rows:
+                continue
+            try:
+                actions[bean_name] = self._apply(bean_name, entry)
+            except Exception as e:
+                # 失敗した豆は未反映のまま残し、次の確認で再度試す
+                print(f"{bean_name}の変更の反映に失敗: {e}")
+                continue
+            del self.pending[bean_name]
+            self._save_state()
+        return actions
+
+    def _apply(self, bean_name, entry):
+        if self.update is not None and entry['rows'] < self.retrain_rows and self.has_model(bean_name):
+            rows = self._query(PENDING_ROWS_QUERY, (bean_name, entry['since'], entry['until']))
+            recipe_ids, records, targets = recipe_updates(rows)
+            if records:
+                self.update(bean_name, recipe_ids, records, targets)
+            self.updated += 1
+            print(f"{bean_name}: 追加された{entry['rows']}行でオンライン更新しました")
+            return 'update'
+
+        self.retrain(bean_name)
+        self.retrained += 1
+        print(f"{bean_name}: 追加された{entry['rows']}行を含めて再学習しました")
+        return 'retrain'
+
+    def start(self):
+        """確認のバックグラウンドスレッドを開始（担当でないワーカーは担当が空くのを待つ）"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='change-poller', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.is_leader():
+                    self.poll()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"レシピの変更確認エラー: {e}")
+
+    def stats(self):
+        """確認の状況"""
+        return {
+            "running": self._thread is not None,
+            "leader": self._lock_file is not None,
+            "interval_seconds": self.interval,
+            "watermark": self.watermark,
+            "pending": {name: entry['rows'] for name, entry in self.pending.items()},
+            "polls": self.polls,
+            "retrained": self.retrained,
+            "updated": self.updated,
+            "last_error": self.last_error
+        }
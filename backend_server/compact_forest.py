@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+RandomForest のメモリを減らした表現（CompactForest）
+
+sklearn の木はノードごとに 64 ビットの子ノード番号・特徴量番号・しきい値・不純度・サンプル数と
+float64 のノードの値（ターゲット数分）を持つ。予測に必要なのはそのうち子ノード・特徴量・しきい値と葉の値だけなので、
+    - しきい値は float32（sklearn は入力を float32 にして比較するため、しきい値を float32 に切り下げれば分岐は変わらない）
+    - 子ノード番号・特徴量番号は値が収まる最小の整数型
+    - 葉の値は float32、または uint16 / uint8 に量子化（ターゲットごとの最小値〜最大値を等間隔に分割）
+    - 同じ値の葉は1つにまとめる（少ないデータで学習した森の葉はほとんどが学習データの1行の値なので、重複が多い）
+にして保持する。全ての木を1つの配列にまとめ、全ての木を同時に1段ずつたどって予測する。
+
+forest_utils.py の予測区間は apply() と leaf_value_table() で同じように計算できる
+（CompactForest の apply() はノード番号ではなく、まとめた葉の値の表の行番号を返す）。
+
+COMPACT_FORESTS_ENABLED=true の場合、モデルの読み込み時（model_registry.py）に豆ごとの森を CompactForest にする。
+モデルストアのバージョンに compact_model.pkl（このコマンドで確認して保存したもの）があればそれを使い、
+無ければ読み込み時に float32 で変換する。
+
+使い方:
+    python compact_forest.py                        # 全ての豆の CURRENT を変換し、豆の学習データで予測を比較（保存しない）
+    python compact_forest.py --save                 # 比較に合格したものを compact_model.pkl として保存
+    python compact_forest.py --leaf-dtype uint8     # 葉の値を量子化
+    python compact_forest.py --bean "豆名" ...       # 指定した豆だけ
+"""
+
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from features import TARGET_TOLERANCES
+
+# モデルの読み込み時に CompactForest にするかどうか（true / false）
+COMPACT_FORESTS_ENABLED = os.getenv('COMPACT_FORESTS_ENABLED', 'false').lower() == 'true'
+
+# 葉の値の型（float32 / uint16 / uint8）
+COMPACT_FOREST_LEAF_DTYPE = os.getenv('COMPACT_FOREST_LEAF_DTYPE', 'float32')
+
+# 元の森との予測の差の上限（各ターゲットの許容誤差に対する割合）
+COMPACT_FOREST_MAX_ERROR = float(os.getenv('COMPACT_FOREST_MAX_ERROR', '0.01'))
+
+LEAF_DTYPES = {'float32': np.float32, 'uint16': np.uint16, 'uint8': np.uint8}
+
+
+def _index_dtype(max_value):
+    """0 〜 max_value が収まる最小の整数型（葉の印の -1 を使うため符号付き）"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _float32_floor(values):
+    """float32 で values 以下の最大の値（float32 の入力 x について x <= t と x <= floor(t) が同じになる）"""
+    rounded = values.astype(np.float32)
+    over = rounded > values
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+
+class CompactForest:
+    """RandomForestRegressor の予測に必要な部分だけを小さい型で持つ森"""
+
+    def __init__(self, forest, leaf_dtype='float32'):
+        if leaf_dtype not in LEAF_DTYPES:
+            raise ValueError(f"葉の値の型は {', '.join(LEAF_DTYPES)} のいずれかです: {leaf_dtype}")
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        node_counts = np.array([tree.node_count for tree in trees])
+
+        self.n_estimators = len(trees)
+        self.n_features_in_ = forest.n_features_in_
+        self.n_outputs_ = forest.n_outputs_
+        self.feature_importances_ = forest.feature_importances_
+        if hasattr(forest, 'feature_names_in_'):
+            self.feature_names_in_ = forest.feature_names_in_
+        self.leaf_dtype = leaf_dtype
+        self.max_depth = max(tree.max_depth for tree in trees)
+
+        # 各木の先頭ノードの位置（全ての木のノードを1つの配列にまとめる）
+        self.offsets = np.concatenate([[0], np.cumsum(node_counts[:-1])]).astype(_index_dtype(node_counts.sum()))
+
+        child_dtype = _index_dtype(node_counts.max())
+        self.left = np.concatenate([tree.children_left for tree in trees]).astype(child_dtype)
+        self.right = np.concatenate([tree.children_right for tree in trees]).astype(child_dtype)
+        is_leaf = self.left < 0
+
+        # 葉の特徴量番号（sklearn では -2）は 0 にして、葉でも入力の列を参照できるようにする
+        feature = np.concatenate([tree.feature for tree in trees])
+        feature[is_leaf] = 0
+        self.feature = feature.astype(_index_dtype(self.n_features_in_))
+        self.threshold = _float32_floor(np.concatenate([tree.threshold for tree in trees]))
+
+        # 欠損値を左に送るノード（欠損値に対応した sklearn で学習した場合のみ）
+        self.missing_go_to_left = None
+        if hasattr(trees[0], 'missing_go_to_left'):
+            missing_go_to_left = np.concatenate([tree.missing_go_to_left for tree in trees]).astype(bool)
+            if missing_go_to_left[~is_leaf].any():
+                self.missing_go_to_left = missing_go_to_left
+
+        # 葉の値を変換して、同じ値の葉をまとめる
+        leaf_values = np.concatenate([tree.value[:, :, 0] for tree in trees])[is_leaf]
+        encoded = self._encode(leaf_values)
+        self.leaf_values, inverse = np.unique(encoded, axis=0, return_inverse=True)
+        self.leaf_index = np.zeros(len(self.left), dtype=_index_dtype(len(self.leaf_values)))
+        self.leaf_index[is_leaf] = inverse.ravel()
+        self._decoded = None
+
+    def _encode(self, values):
+        """葉の値を leaf_dtype に変換（量子化の場合はターゲットごとの最小値と刻み幅を保存）"""
+        if self.leaf_dtype == 'float32':
+            self.value_offset = self.value_scale = None
+            return values.astype(np.float32)
+        levels = np.iinfo(LEAF_DTYPES[self.leaf_dtype]).max
+        low = values.min(axis=0)
+        scale = (values.max(axis=0) - low) / levels
+        scale[scale == 0] = 1.0
+        self.value_offset, self.value_scale = low, scale
+        return np.rint((values - low) / scale).astype(LEAF_DTYPES[self.leaf_dtype])
+
+    def leaf_value_table(self):
+        """
+        まとめた葉の値の表（forest_utils.leaf_value_table と同じ形式）
+
+        Returns:
+            tuple: (葉の値 (値の種類数, ターゲット数), 各木の先頭の位置（apply() が表の行番号を返すため全て0）)
+        """
+        if self._decoded is None:
+            values = self.leaf_values.astype(np.float64)
+            if self.value_scale is not None:
+                values = values * self.value_scale + self.value_offset
+            self._decoded = values
+        return self._decoded, np.zeros(self.n_estimators, dtype=np.intp)
+
+    def apply(self, X):
+        """
+        各木で入力がたどり着く葉の値の表の行番号
+
+        Returns:
+            np.ndarray: (行数, 木の数)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, np.newaxis]
+        offsets = self.offsets.astype(np.int64)
+        nodes = np.broadcast_to(offsets, (len(X), self.n_estimators)).copy()
+
+        # 全ての木を同時に1段ずつたどる（全ての行・木が葉に着いたら終了）
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            active = left >= 0
+            if not active.any():
+                break
+            x = X[rows, self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if self.missing_go_to_left is not None:
+                go_left |= np.isnan(x) & self.missing_go_to_left[nodes]
+            child = np.where(go_left, left, self.right[nodes])
+            nodes = np.where(active, offsets + child, nodes)
+        return self.leaf_index[nodes]
+
+    def predict(self, X):
+        values, _ = self.leaf_value_table()
+        predictions = values[self.apply(X)].mean(axis=1)
+        return predictions[:, 0] if self.n_outputs_ == 1 else predictions
+
+    def nbytes(self):
+        """予測に使う配列のバイト数"""
+        arrays = [self.offsets, self.left, self.right, self.feature, self.threshold, self.leaf_values, self.leaf_index]
+        if self.missing_go_to_left is not None:
+            arrays.append(self.missing_go_to_left)
+        return sum(array.nbytes for array in arrays)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_decoded'] = None
+        return state
+
+
+def is_forest(model):
+    return hasattr(model, 'estimators_') and hasattr(model, 'n_outputs_') and hasattr(model.estimators_[0], 'tree_')
+
+
+def pickled_size(model):
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def equivalence_report(original, compact, X, y, target_names, max_error=COMPACT_FOREST_MAX_ERROR):
+    """
+    元の森と CompactForest の予測を豆のデータで比較
+
+    各ターゲットの予測の差の最大値が許容誤差の max_error 倍以下なら合格。
+    許容誤差内正解率（元の森と CompactForest それぞれの実測値に対する正解率）と、保存時のサイズも返す。
+
+    Returns:
+        dict: passed / max_abs_diff / accuracy / bytes
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    original_predictions = np.asarray(original.predict(X)).reshape(len(X), -1)
+    compact_predictions = np.asarray(compact.predict(X)).reshape(len(X), -1)
+    tolerances = np.array([TARGET_TOLERANCES[name] for name in target_names])
+
+    max_abs_diff = np.abs(compact_predictions - original_predictions).max(axis=0)
+    original_within = np.abs(original_predictions - y) <= tolerances
+    compact_within = np.abs(compact_predictions - y) <= tolerances
+    original_bytes = pickled_size(original)
+    compact_bytes = pickled_size(compact)
+
+    return {
+        'passed': bool((max_abs_diff <= tolerances * max_error).all()),
+        'leaf_dtype': compact.leaf_dtype,
+        'sample_count': len(X),
+        'max_abs_diff': dict(zip(target_names, max_abs_diff.tolist())),
+        'accuracy': {
+            'original': dict(zip(target_names + ['all'], original_within.mean(axis=0).tolist() + [float(original_within.all(axis=1).mean())])),
+            'compact': dict(zip(target_names + ['all'], compact_within.mean(axis=0).tolist() + [float(compact_within.all(axis=1).mean())]))
+        },
+        'bytes': {
+            'original': original_bytes,
+            'compact': compact_bytes,
+            'saved': original_bytes - compact_bytes,
+            'ratio': compact_bytes / original_bytes if original_bytes else None,
+            'compact_arrays': compact.nbytes(),
+            'unique_leaves': len(compact.leaf_values),
+            'leaves': int((compact.left < 0).sum())
+        }
+    }
+
+
+def align_features(data, feature_names):
+    """学習データの列をモデルの特徴量の順に並べる（学習後に出現した天気の列は除き、無い列は0）"""
+    if list(data.feature_names) == list(feature_names):
+        return data.X
+    column_index = {name: i for i, name in enumerate(data.feature_names)}
+    X = np.zeros((len(data.X), len(feature_names)))
+    for i, name in enumerate(feature_names):
+        if name in column_index:
+            X[:, i] = data.X[:, column_index[name]]
+    return X
+
+
+def compact_bean(store, bean_name, training_data, leaf_dtype=COMPACT_FOREST_LEAF_DTYPE, save=False):
+    """
+    豆の CURRENT のモデルを CompactForest にして、豆の学習データで元の森と比較
+
+    Returns:
+        dict: 比較結果（equivalence_report）に豆名・バージョン・保存したかどうかを加えたもの。森でないモデルの場合はNone
+    """
+    loaded = store.load(bean_name)
+    if loaded is None:
+        return None
+    model, preprocessing_info, version = loaded
+    if not is_forest(model):
+        return None
+
+    compact = CompactForest(model, leaf_dtype)
+    data = training_data(bean_name)
+    report = equivalence_report(
+        model, compact, align_features(data, preprocessing_info['feature_names']), data.y,
+        list(preprocessing_info['target_names'])
+    )
+    report.update({'bean_name': bean_name, 'model_version': version, 'saved': False})
+    if save and report['passed']:
+        store.save_compact(bean_name, version, compact, report)
+        report['saved'] = True
+    return report
+
+
+def main():
+    from db_config import get_mysql_config
+    from feature_cache import TrainingDataCache
+    from model_store import ModelStore
+
+    parser = argparse.ArgumentParser(description='豆ごとの森を CompactForest に変換して元の森と比較')
+    parser.add_argument('--leaf-dtype', choices=sorted(LEAF_DTYPES), default=COMPACT_FOREST_LEAF_DTYPE, help='葉の値の型')
+    parser.add_argument('--bean', action='append', dest='beans', help='変換する豆名（複数指定可）')
+    parser.add_argument('--save', action='store_true', help='比較に合格したものを compact_model.pkl として保存')
+    args = parser.parse_args()
+
+    store = ModelStore()
+    training_data = TrainingDataCache(get_mysql_config()).get
+    failed = []
+    total_original = total_compact = 0
+
+    print(f"{'豆名':<24} {'元(KB)':>9} {'変換後(KB)':>10} {'比率':>6} {'最大誤差(mesh/gram/time)':>28} {'正解率(元→後)':>15} 結果")
+    for bean_name in args.beans or store.bean_names():
+        report = compact_bean(store, bean_name, training_data, args.leaf_dtype, args.save)
+        if report is None:
+            continue
+        sizes = report['bytes']
+        total_original += sizes['original']
+        total_compact += sizes['compact']
+        diffs = '/'.join(f"{value:.4f}" for value in report['max_abs_diff'].values())
+        accuracy = f"{report['accuracy']['original']['all']:.3f}→{report['accuracy']['compact']['all']:.3f}"
+        result = ('✅ 保存' if report['saved'] else '✅') if report['passed'] else '❌ 不合格'
+        print(f"{bean_name:<24} {sizes['original'] / 1024:>9.1f} {sizes['compact'] / 1024:>10.1f} "
+              f"{sizes['ratio']:>6.3f} {diffs:>28} {accuracy:>15} {result}")
+        if not report['passed']:
+            failed.append(bean_name)
+
+    if total_original:
+        print(f"合計: {total_original / 1024:.1f}KB → {total_compact / 1024:.1f}KB "
+              f"({(total_original - total_compact) / 1024:.1f}KB 削減, {total_compact / total_original:.1%})")
+    if failed:
+        print(f"❌ 元の森と予測が一致しない豆: {', '.join(failed)}（--leaf-dtype float32 で再実行してください）")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
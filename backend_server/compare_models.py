@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+豆ごとのモデルの比較（RandomForest・MLP・HistGradientBoosting・CompactForest）
+
+各豆の学習データを同じ分割（KFold、COMPARE_FOLDS 分割）で学習・評価し、以下を1つの表にまとめる。
+    - 学習時間（1分割あたりの平均。CompactForest は RandomForest の学習と変換の合計）
+    - 1行の予測の時間（COMPARE_LATENCY_REPEATS 回の中央値）と COMPARE_BATCH_SIZE 行の一括予測の時間
+    - 保存時のサイズ（pickle）
+    - 許容誤差内正解率（mesh / gram / extraction_time と全項目。全ての分割の検証データの予測で計算）
+
+MLP は app_mysql.py にコメントアウトで残している設定（入力と出力を StandardScaler で標準化）と同じ。
+ただし MLP は欠損値を扱えないため、気温・湿度が無い行は学習データの中央値で補う（SimpleImputer）。
+HistGradientBoosting は1ターゲットずつ学習する（MultiOutputRegressor）。
+比較の条件を揃えるため、学習ポリシーの行の選択と重み（MLP は sample_weight に対応していない）は使わない。
+レシピが COMPARE_MIN_SAMPLES 件未満の豆は、--bean で指定しても省略する。
+学習に失敗したモデルは、その豆の結果に error として記録し、残りのモデルの比較を続ける。
+
+使い方:
+    python compare_models.py                          # レシピが COMPARE_MIN_SAMPLES 件以上ある全ての豆
+    python compare_models.py --bean "豆名" ...         # 指定した豆だけ
+    python compare_models.py --model random_forest --model compact_forest
+    python compare_models.py --snapshot               # レシピのスナップショットから（MySQL に接続しない）
+    python compare_models.py --json model/compare_models.json   # 結果を JSON で保存
+"""
+
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+from compact_forest import CompactForest
+from features import TARGET_NAMES, TARGET_TOLERANCES
+
+# 交差検証の分割数（データが少ない豆は行数まで）
+COMPARE_FOLDS = int(os.getenv('COMPARE_FOLDS', '5'))
+
+# 1行の予測の時間を計測する回数
+COMPARE_LATENCY_REPEATS = int(os.getenv('COMPARE_LATENCY_REPEATS', '50'))
+
+# 一括予測の時間を計測する行数
+COMPARE_BATCH_SIZE = int(os.getenv('COMPARE_BATCH_SIZE', '1000'))
+
+# 比較する豆のレシピ数の下限（これより少ない豆は分割ごとの検証データが少なすぎる）
+COMPARE_MIN_SAMPLES = int(os.getenv('COMPARE_MIN_SAMPLES', '10'))
+
+
+def _random_forest():
+    from sklearn.ensemble import RandomForestRegressor
+    # training.train_bean_model と同じ設定
+    return RandomForestRegressor(n_estimators=100, random_state=42)
+
+
+def _mlp():
+    from sklearn.compose import TransformedTargetRegressor
+    from sklearn.impute import SimpleImputer
+    from sklearn.neural_network import MLPRegressor
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    regressor = make_pipeline(
+        SimpleImputer(strategy='median'),
+        StandardScaler(),
+        MLPRegressor(
+            hidden_layer_sizes=(32, 16),
+            activation='relu',
+            solver='adam',
+            alpha=1e-3,
+            learning_rate_init=1e-3,
+            max_iter=5000,
+            early_stopping=True,
+            n_iter_no_change=20,
+            random_state=42
+        )
+    )
+    return TransformedTargetRegressor(regressor=regressor, transformer=StandardScaler())
+
+
+def _hist_gradient_boosting():
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from sklearn.multioutput import MultiOutputRegressor
+    return MultiOutputRegressor(HistGradientBoostingRegressor(random_state=42))
+
+
+def _fit(factory, X, y):
+    model = factory()
+    model.fit(X, y)
+    return model
+
+
+def _fit_compact(X, y):
+    return CompactForest(_fit(_random_forest, X, y))
+
+
+# モデル名 -> 学習データから学習済みモデルを返す関数
+CANDIDATES = {
+    'random_forest': lambda X, y: _fit(_random_forest, X, y),
+    'mlp': lambda X, y: _fit(_mlp, X, y),
+    'hist_gradient_boosting': lambda X, y: _fit(_hist_gradient_boosting, X, y),
+    'compact_forest': _fit_compact,
+}
+
+
+def _splits(n_rows, folds=COMPARE_FOLDS):
+    """全てのモデルで共通の分割（学習用の行, 検証用の行）のリスト"""
+    from sklearn.model_selection import KFold
+    return list(KFold(n_splits=min(folds, n_rows), shuffle=True, random_state=42).split(np.arange(n_rows)))
+
+
+def _latency(model, X, repeats=COMPARE_LATENCY_REPEATS, batch_size=COMPARE_BATCH_SIZE):
+    """(1行の予測の秒数の中央値, batch_size 行の一括予測の秒数)"""
+    row = X[:1]
+    model.predict(row)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict(row)
+        timings.append(time.perf_counter() - started)
+
+    batch = np.resize(X, (batch_size, X.shape[1]))
+    started = time.perf_counter()
+    model.predict(batch)
+    return float(np.median(timings)), time.perf_counter() - started
+
+
+def compare_bean(data, model_names=None, folds=COMPARE_FOLDS):
+    """
+    1つの豆の学習データ（feature_cache.TrainingData）で各モデルを比較
+
+    Returns:
+        list: モデルごとの結果（model / fit_seconds / predict_row_ms / predict_batch_ms / model_bytes / tolerance_accuracy）。
+              学習・予測に失敗したモデルは model / error だけ
+    """
+    X, y = data.X, data.y
+    splits = _splits(len(X), folds)
+    tolerances = np.array([TARGET_TOLERANCES[name] for name in TARGET_NAMES])
+    results = []
+
+    for name in model_names or CANDIDATES:
+        fit = CANDIDATES[name]
+        predictions = np.zeros_like(y, dtype=np.float64)
+        fit_seconds = []
+        first_model = None
+        try:
+            for train_rows, test_rows in splits:
+                started = time.perf_counter()
+                model = fit(X[train_rows], y[train_rows])
+                fit_seconds.append(time.perf_counter() - started)
+                predictions[test_rows] = np.asarray(model.predict(X[test_rows])).reshape(len(test_rows), -1)
+                if first_model is None:
+                    first_model = model
+
+            # 時間とサイズは最初の分割のモデルで計測（分割ごとの学習データの行数はほぼ同じ）
+            row_seconds, batch_seconds = _latency(first_model, X)
+        except Exception as e:
+            print(f"  {name}: 学習に失敗しました: {e}")
+            results.append({'model': name, 'error': str(e)})
+            continue
+        within = np.abs(predictions - y) <= tolerances
+        accuracy = dict(zip(TARGET_NAMES, within.mean(axis=0).tolist()))
+        accuracy['overall'] = float(within.all(axis=1).mean())
+        results.append({
+            'model': name,
+            'fit_seconds': float(np.mean(fit_seconds)),
+            'predict_row_ms': row_seconds * 1000,
+            'predict_batch_ms': batch_seconds * 1000,
+            'model_bytes': len(pickle.dumps(first_model, protocol=pickle.HIGHEST_PROTOCOL)),
+            'tolerance_accuracy': accuracy
+        })
+    return results
+
+
+def print_table(comparisons):
+    """豆・モデルごとの結果と、モデルごとの全ての豆の平均を表示"""
+    header = (f"{'豆名':<20} {'モデル':<24} {'学習(秒)':>9} {'1行(ms)':>8} {f'{COMPARE_BATCH_SIZE}行(ms)':>10} "
+              f"{'サイズ(KB)':>10} {'mesh':>6} {'gram':>6} {'time':>6} {'全項目':>6}")
+    print(header)
+
+    def row(label, name, result):
+        if 'error' in result:
+            print(f"{label:<20} {name:<24} 失敗: {result['error']}")
+            return
+        accuracy = result['tolerance_accuracy']
+        print(f"{label:<20} {name:<24} {result['fit_seconds']:>9.3f} {result['predict_row_ms']:>8.2f} "
+              f"{result['predict_batch_ms']:>10.1f} {result['model_bytes'] / 1024:>10.1f} "
+              f"{accuracy['mesh']:>6.3f} {accuracy['gram']:>6.3f} {accuracy['extraction_time']:>6.3f} "
+              f"{accuracy['overall']:>6.3f}")
+
+    by_model = {}
+    for comparison in comparisons:
+        for result in comparison['results']:
+            row(comparison['bean_name'], result['model'], result)
+            if 'error' not in result:
+                by_model.setdefault(result['model'], []).append(result)
+
+    if len(comparisons) > 1:
+        print("--- 平均（失敗した豆を除く） ---")
+        for name, results in by_model.items():
+            mean = {key: float(np.mean([r[key] for r in results]))
+                    for key in ('fit_seconds', 'predict_row_ms', 'predict_batch_ms', 'model_bytes')}
+            mean['tolerance_accuracy'] = {
+                key: float(np.mean([r['tolerance_accuracy'][key] for r in results]))
+                for key in TARGET_NAMES + ['overall']
+            }
+            row(f"{len(results)}豆", name, mean)
+
+
+def main():
+    from db_config import get_mysql_config
+    from feature_cache import TrainingDataCache
+    from recipe_snapshot import RECIPE_SNAPSHOT_DIR, RecipeSnapshot
+    from retrain_all import fetch_bean_versions
+
+    parser = argparse.ArgumentParser(description='豆ごとに RandomForest・MLP・HistGradientBoosting・CompactForest を比較')
+    parser.add_argument('--bean', action='append', dest='beans', help='比較する豆名（複数指定可）')
+    parser.add_argument('--model', action='append', dest='models', choices=list(CANDIDATES), help='比較するモデル（複数指定可）')
+    parser.add_argument('--folds', type=int, default=COMPARE_FOLDS, help='交差検証の分割数')
+    parser.add_argument('--snapshot', nargs='?', const=RECIPE_SNAPSHOT_DIR, default=None,
+                        help='レシピのスナップショットから読み込む（ディレクトリ省略時: RECIPE_SNAPSHOT_DIR）')
+    parser.add_argument('--json', dest='json_path', help='結果を保存する JSON ファイル')
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot = RecipeSnapshot(args.snapshot)
+        bean_names = args.beans or sorted(snapshot.bean_versions())
+        training_data = snapshot.training_data
+    else:
+        mysql_config = get_mysql_config()
+        bean_names = args.beans or sorted(fetch_bean_versions(mysql_config))
+        training_data = TrainingDataCache(mysql_config).get
+
+    comparisons = []
+    for bean_name in bean_names:
+        data = training_data(bean_name)
+        if data.sample_count < COMPARE_MIN_SAMPLES:
+            print(f"{bean_name}: データが少なすぎるので省略します（{data.sample_count}件）")
+            continue
+        print(f"{bean_name}: {data.sample_count}件で比較中...")
+        comparisons.append({
+            'bean_name': bean_name,
+            'sample_count': data.sample_count,
+            'results': compare_bean(data, args.models, args.folds)
+        })
+
+    print()
+    print_table(comparisons)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(comparisons, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
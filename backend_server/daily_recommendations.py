@@ -0,0 +1,360 @@
+"""
+豆ごとの日次おすすめレシピの事前計算テーブル
+朝に「今日のレシピ」を何度も /predict で計算する代わりに、定期ジョブで
+有効な全ての豆について 今日から DAILY_RECOMMENDATION_DAYS 日分 × 天気 の予測をまとめて計算しておく
+
+- 気温・湿度は気象データ（data/kyoto_weather_data.csv）の同じ月日の平均を使う
+- days_passed は豆の最新レシピから日数を進めた値を使う
+- 豆ごとに (日数, 天気数, ターゲット数) の float32 配列を持ち、(豆名, 日付, 天気) で O(1) で引ける
+- モデルのバージョン（オンライン更新の回数を含むモデルストアのバージョン）が変わった豆だけを再計算し、テーブルは DAILY_RECOMMENDATION_FILE に保存する
+"""
+
+import os
+import pickle
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+import numpy as np
+
+from features import TARGET_NAMES, as_model_input, encode_inputs
+
+# 事前計算する日数（今日を含む）
+DAILY_RECOMMENDATION_DAYS = int(os.getenv('DAILY_RECOMMENDATION_DAYS', '7'))
+
+# 再計算ジョブの実行間隔（秒）
+DAILY_RECOMMENDATION_INTERVAL_SECONDS = float(os.getenv('DAILY_RECOMMENDATION_INTERVAL_SECONDS', '3600'))
+
+# 最新レシピがこの日数以内の豆だけを対象にする（0の場合は全ての豆）
+DAILY_RECOMMENDATION_ACTIVE_DAYS = int(os.getenv('DAILY_RECOMMENDATION_ACTIVE_DAYS', '0'))
+
+# 定期ジョブを有効にするか（true / false）
+DAILY_RECOMMENDATION_ENABLED = os.getenv('DAILY_RECOMMENDATION_ENABLED', 'true').lower() == 'true'
+
+DAILY_RECOMMENDATION_FILE = 'model/daily_recommendations.pkl'
+
+WEATHER_DATA_FILE = 'data/kyoto_weather_data.csv'
+
+# 事前計算する天気（モデルの weather_ 列が無い場合に使う）
+DEFAULT_WEATHERS = ['晴れ', '曇り', '雨', '雪']
+
+# 気象データもレシピも無い場合の値
+DEFAULT_TEMPERATURE = 20.0
+DEFAULT_HUMIDITY = 60.0
+DEFAULT_DAYS_PASSED = 15.0
+
+# 豆ごとの最新レシピ（産地・日付・経過日数）
+BEAN_STATE_QUERY = """
+SELECT b.name, b.from_location, r.date, r.days_passed
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+JOIN (SELECT bean_id, MAX(id) AS max_id FROM recipe GROUP BY bean_id) latest ON r.id = latest.max_id
+"""
+
+
+class WeatherClimatology:
+    """月日ごとの平均気温・湿度（該当日が無ければ月平均、それも無ければデフォルト値）"""
+
+    def __init__(self, path=WEATHER_DATA_FILE):
+        import pandas as pd
+
+        self.by_day = {}
+        self.by_month = {}
+        try:
+            df = pd.read_csv(path, parse_dates=['date'])
+        except FileNotFoundError:
+            print(f"気象データが見つかりません: {path}（デフォルトの気温・湿度を使用します）")
+            return
+
+        df['month'] = df['date'].dt.month
+        df['day'] = df['date'].dt.day
+        for (month, day), group in df.groupby(['month', 'day']):
+            self.by_day[(month, day)] = (float(group['temperature'].mean()), float(group['humidity'].mean()))
+        for month, group in df.groupby('month'):
+            self.by_month[month] = (float(group['temperature'].mean()), float(group['humidity'].mean()))
+
+    def lookup(self, target_date):
+        """(気温, 湿度) を取得"""
+        return self.by_day.get(
+            (target_date.month, target_date.day),
+            self.by_month.get(target_date.month, (DEFAULT_TEMPERATURE, DEFAULT_HUMIDITY))
+        )
+
+
+class BeanRecommendations:
+    """1つの豆の事前計算結果（start_date から days 日分 × 天気）"""
+
+    def __init__(self, bean_name, model_version, model_kind, start_date, weathers, temperature, humidity, days_passed, values):
+        self.bean_name = bean_name
+        self.model_version = model_version
+        self.model_kind = model_kind
+        self.start_date = start_date
+        self.weathers = weathers
+        self.weather_index = {w: i for i, w in enumerate(weathers)}
+        self.temperature = temperature      # (日数,) float32
+        self.humidity = humidity            # (日数,) float32
+        self.days_passed = days_passed      # (日数,) float32
+        self.values = values                # (日数, 天気数, ターゲット数) float32
+        self.generated_at = datetime.now().isoformat()
+
+    @property
+    def days(self):
+        return self.values.shape[0]
+
+    def entry(self, day, weather_i):
+        target_date = self.start_date + timedelta(days=day)
+        result = {
+            "date": target_date.isoformat(),
+            "weather": self.weathers[weather_i],
+            "temperature": float(self.temperature[day]),
+            "humidity": float(self.humidity[day]),
+            "days_passed": float(self.days_passed[day])
+        }
+        for i, target in enumerate(TARGET_NAMES):
+            result[target] = float(self.values[day, weather_i, i])
+        return result
+
+    def lookup(self, target_date, weather=None):
+        """
+        指定日（と天気）のおすすめを取得
+
+        Returns:
+            list: おすすめのリスト（天気を指定した場合は1件）。範囲外・未知の天気の場合はNone
+        """
+        day = (target_date - self.start_date).days
+        if not 0 <= day < self.days:
+            return None
+        if weather is None:
+            return [self.entry(day, i) for i in range(len(self.weathers))]
+        weather_i = self.weather_index.get(weather)
+        if weather_i is None:
+            return None
+        return [self.entry(day, weather_i)]
+
+
+def model_version(model_kind, version):
+    """モデルのバージョン（モデルレジストリのバージョン。オンライン更新の補正が変わっても別のバージョン）"""
+    return f"{model_kind}:{version}"
+
+
+def model_weathers(preprocessing_info):
+    """モデルが学習した天気の一覧"""
+    weathers = [name[len('weather_'):] for name in preprocessing_info['feature_names'] if name.startswith('weather_')]
+    return weathers or DEFAULT_WEATHERS
+
+
+def build_bean_recommendations(bean_name, bean_origin, last_date, last_days_passed, start_date, days,
+                               model, preprocessing_info, model_kind, version, climatology):
+    """1つの豆の days 日分 × 天気 をまとめて予測"""
+    weathers = model_weathers(preprocessing_info)
+    dates = [start_date + timedelta(days=d) for d in range(days)]
+    weather_values = np.array([climatology.lookup(d) for d in dates], dtype=np.float32)
+
+    base_days_passed = DEFAULT_DAYS_PASSED if last_days_passed is None else float(last_days_passed)
+    if last_date is not None:
+        days_passed = np.array([base_days_passed + (d - last_date).days for d in dates], dtype=np.float32)
+    else:
+        days_passed = np.full(days, base_days_passed, dtype=np.float32)
+
+    records = [
+        {
+            'bean_name': bean_name,
+            'bean_origin': bean_origin,
+            'date': d.isoformat(),
+            'weather': weather,
+            'temperature': float(weather_values[i, 0]),
+            'humidity': float(weather_values[i, 1]),
+            'days_passed': float(days_passed[i])
+        }
+        for i, d in enumerate(dates)
+        for weather in weathers
+    ]
+
+    feature_names = preprocessing_info['feature_names']
+    X = encode_inputs(
+        records,
+        feature_names,
+        bean_target_means=preprocessing_info.get('bean_target_means'),
+        default_bean_means=preprocessing_info.get('default_bean_means')
+    )
+    prediction = model.predict(as_model_input(model, X, feature_names))
+
+    return BeanRecommendations(
+        bean_name,
+        model_version(model_kind, version),
+        model_kind,
+        start_date,
+        weathers,
+        weather_values[:, 0].copy(),
+        weather_values[:, 1].copy(),
+        days_passed,
+        np.asarray(prediction, dtype=np.float32).reshape(days, len(weathers), -1)
+    )
+
+
+class DailyRecommendationTable:
+    """全ての豆の事前計算結果（豆名 -> BeanRecommendations）"""
+
+    def __init__(self, mysql_config, resolve_model, path=DAILY_RECOMMENDATION_FILE,
+                 days=DAILY_RECOMMENDATION_DAYS, interval=DAILY_RECOMMENDATION_INTERVAL_SECONDS):
+        """
+        Args:
+            resolve_model: 豆名 -> (モデル, 前処理情報, モデル種別, バージョン) を返す関数
+        """
+        self.mysql_config = mysql_config
+        self.resolve_model = resolve_model
+        self.path = path
+        self.days = days
+        self.interval = interval
+        self._climatology = None
+        self.beans = {}
+        self.refreshed_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._load()
+
+    @property
+    def climatology(self):
+        """気象データの平均（最初の計算時に読み込む）"""
+        if self._climatology is None:
+            self._climatology = WeatherClimatology()
+        return self._climatology
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                self.beans = pickle.load(f)
+            print(f"日次おすすめを読み込みました: {len(self.beans)}件の豆")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"日次おすすめの読み込みに失敗: {e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # 各ワーカーが同時に保存しても一時ファイルが重ならないように、プロセスごとに別の名前にする
+        tmp_path = f"{self.path}.tmp.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.beans, f)
+        os.replace(tmp_path, self.path)
+
+    def fetch_bean_states(self):
+        """豆ごとの最新レシピを取得（豆名 -> (産地, 最新の日付, 経過日数)）"""
+        connection = mysql.connector.connect(**self.mysql_config)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(BEAN_STATE_QUERY)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+
+        states = {}
+        for name, origin, last_date, days_passed in rows:
+            if isinstance(last_date, str):
+                last_date = datetime.strptime(last_date[:10], "%Y-%m-%d").date()
+            elif isinstance(last_date, datetime):
+                last_date = last_date.date()
+            states[name] = (origin, last_date, days_passed)
+        return states
+
+    def refresh(self, today=None):
+        """
+        有効な豆のおすすめを更新（モデルのバージョンか開始日が変わった豆だけを再計算）
+
+        Returns:
+            dict: 再計算・削除した豆の数
+        """
+        with self._lock:
+            today = today or date.today()
+            states = self.fetch_bean_states()
+            beans = dict(self.beans)
+            active = set()
+            regenerated = 0
+
+            for bean_name, (origin, last_date, days_passed) in states.items():
+                if DAILY_RECOMMENDATION_ACTIVE_DAYS and last_date is not None \
+                        and (today - last_date).days > DAILY_RECOMMENDATION_ACTIVE_DAYS:
+                    continue
+                model, preprocessing_info, model_kind, version = self.resolve_model(bean_name)
+                if model is None:
+                    continue
+                active.add(bean_name)
+
+                current = beans.get(bean_name)
+                if current is not None and current.start_date == today and current.days == self.days \
+                        and current.model_version == model_version(model_kind, version):
+                    continue
+
+                try:
+                    beans[bean_name] = build_bean_recommendations(
+                        bean_name, origin, last_date, days_passed, today, self.days,
+                        model, preprocessing_info, model_kind, version, self.climatology
+                    )
+                    regenerated += 1
+                except Exception as e:
+                    print(f"{bean_name}の日次おすすめ計算に失敗: {e}")
+
+            # 対象外になった豆（モデルが無い・最近使われていない）は削除
+            removed = sum(1 for name in beans if name not in active)
+            beans = {name: recommendations for name, recommendations in beans.items() if name in active}
+
+            # 豆ごとの差し替えは辞書ごと入れ替える（読み取り側はロック不要）
+            self.beans = beans
+            self.refreshed_at = time.time()
+            if regenerated or removed:
+                self._save()
+                print(f"日次おすすめを更新しました: 再計算={regenerated}件, 削除={removed}件, 合計={len(beans)}件")
+            return {"regenerated": regenerated, "removed": removed, "bean_count": len(beans)}
+
+    def lookup(self, bean_name, target_date, weather=None):
+        """事前計算済みのおすすめを取得（無ければNone）"""
+        recommendations = self.beans.get(bean_name)
+        if recommendations is None:
+            return None
+        return recommendations.lookup(target_date, weather)
+
+    def start(self):
+        """定期的に refresh() を実行するバックグラウンドスレッドを開始"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='daily-recommendations', daemon=True)
+        self._thread.start()
+
+    def request_refresh(self):
+        """バックグラウンドスレッドで refresh() をすぐに実行する（呼び出し元は完了を待たない）"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # 更新中に要求された場合は、終わってからもう一度更新する
+            self._wake.clear()
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"日次おすすめの更新エラー: {e}")
+            self._wake.wait(self.interval)
+
+    def stats(self):
+        """テーブルの統計情報"""
+        beans = self.beans
+        return {
+            "enabled": self._thread is not None,
+            "bean_count": len(beans),
+            "days": self.days,
+            "interval_seconds": self.interval,
+            "table_bytes": sum(b.values.nbytes for b in beans.values()),
+            "refreshed_at": datetime.fromtimestamp(self.refreshed_at).isoformat() if self.refreshed_at else None,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,126 @@
+"""
+データベース統計（件数）のキャッシュ
+毎回 COUNT(*) で全件を数える代わりに、各テーブルの最大IDを基準（ウォーターマーク）にして
+新しく追加された行だけを数えて件数を更新する
+
+削除された行は差分では検出できないため、DB_STATS_RESYNC_SECONDS ごとに全件を数え直す
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import mysql.connector
+
+# 差分更新の間隔（秒）。この間はDBに問い合わせずメモリ上の件数を返す
+DB_STATS_REFRESH_SECONDS = float(os.getenv('DB_STATS_REFRESH_SECONDS', '60'))
+
+# 全件を数え直す間隔（秒）
+DB_STATS_RESYNC_SECONDS = float(os.getenv('DB_STATS_RESYNC_SECONDS', '3600'))
+
+
+class DatabaseStats:
+    """users / beans / recipe の件数と豆ごとのレシピ件数"""
+
+    def __init__(self, mysql_config, refresh_seconds=DB_STATS_REFRESH_SECONDS, resync_seconds=DB_STATS_RESYNC_SECONDS):
+        self.mysql_config = mysql_config
+        self.refresh_seconds = refresh_seconds
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+
+        self.user_count = 0
+        self.bean_count = 0
+        self.recipe_count = 0
+        self.recipe_counts_by_bean = {}     # bean_id -> レシピ件数
+        self.bean_names = {}                # bean_id -> 豆名
+        self.watermarks = {'users': 0, 'beans': 0, 'recipe': 0}
+        self.refreshed_at = None
+        self.resynced_at = None
+
+    def get(self, exact=False):
+        """
+        統計情報を取得
+
+        Args:
+            exact: True の場合は全件を数え直す（COUNT(*)）
+        """
+        with self._lock:
+            now = time.time()
+            if exact or self.resynced_at is None or now - self.resynced_at >= self.resync_seconds:
+                self._run(self._resync)
+            elif now - self.refreshed_at >= self.refresh_seconds:
+                self._run(self._refresh)
+
+            return self._snapshot('exact' if exact else 'cached')
+
+    def _run(self, update):
+        connection = mysql.connector.connect(**self.mysql_config)
+        cursor = connection.cursor()
+        try:
+            update(cursor)
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _resync(self, cursor):
+        """全件を数え直す"""
+        cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM users")
+        self.user_count, self.watermarks['users'] = cursor.fetchone()
+
+        cursor.execute("SELECT id, name FROM beans")
+        self.bean_names = dict(cursor.fetchall())
+        self.bean_count = len(self.bean_names)
+        self.watermarks['beans'] = max(self.bean_names, default=0)
+
+        cursor.execute("SELECT bean_id, COUNT(*), MAX(id) FROM recipe GROUP BY bean_id")
+        rows = cursor.fetchall()
+        self.recipe_counts_by_bean = {bean_id: count for bean_id, count, _ in rows}
+        self.recipe_count = sum(self.recipe_counts_by_bean.values())
+        self.watermarks['recipe'] = max((max_id for _, _, max_id in rows), default=0)
+
+        self.refreshed_at = self.resynced_at = time.time()
+        print(f"データベース統計を再集計しました: ユーザー={self.user_count}, 豆={self.bean_count}, レシピ={self.recipe_count}")
+
+    def _refresh(self, cursor):
+        """ウォーターマークより新しい行だけを数えて加算（主キーの範囲検索のみ）"""
+        cursor.execute("SELECT COUNT(*), MAX(id) FROM users WHERE id > %s", (self.watermarks['users'],))
+        count, max_id = cursor.fetchone()
+        if count:
+            self.user_count += count
+            self.watermarks['users'] = max_id
+
+        cursor.execute("SELECT id, name FROM beans WHERE id > %s", (self.watermarks['beans'],))
+        for bean_id, name in cursor.fetchall():
+            self.bean_names[bean_id] = name
+            self.bean_count += 1
+            self.watermarks['beans'] = max(self.watermarks['beans'], bean_id)
+
+        cursor.execute(
+            "SELECT bean_id, COUNT(*), MAX(id) FROM recipe WHERE id > %s GROUP BY bean_id",
+            (self.watermarks['recipe'],)
+        )
+        for bean_id, count, max_id in cursor.fetchall():
+            self.recipe_counts_by_bean[bean_id] = self.recipe_counts_by_bean.get(bean_id, 0) + count
+            self.recipe_count += count
+            self.watermarks['recipe'] = max(self.watermarks['recipe'], max_id)
+
+        self.refreshed_at = time.time()
+
+    def _snapshot(self, mode):
+        per_bean = {}
+        for bean_id, count in self.recipe_counts_by_bean.items():
+            name = self.bean_names.get(bean_id, str(bean_id))
+            per_bean[name] = per_bean.get(name, 0) + count
+
+        return {
+            "user_count": self.user_count,
+            "bean_count": self.bean_count,
+            "recipe_count": self.recipe_count,
+            "total_records": self.user_count + self.bean_count + self.recipe_count,
+            "per_bean_recipe_counts": per_bean,
+            "mode": mode,
+            "refreshed_at": datetime.fromtimestamp(self.refreshed_at).isoformat(),
+            "last_exact_count_at": datetime.fromtimestamp(self.resynced_at).isoformat(),
+            "data_age_seconds": time.time() - self.refreshed_at
+        }
@@ -0,0 +1,185 @@
+"""
+豆ごとの学習データ（特徴量行列）のキャッシュ
+データのバージョン（レシピ件数 + 最大ID）が変わらない限り、
+DBからの取得と特徴量行列の作成を再実行しない
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import mysql.connector
+import numpy as np
+
+from feature_store import execute_recipe_query
+from features import DATE_FEATURE_COLUMNS, NUMERICAL_COLUMNS, RECIPE_COLUMNS, TARGET_NAMES, date_parts
+
+# キャッシュする豆の最大数
+TRAINING_DATA_CACHE_SIZE = int(os.getenv('TRAINING_DATA_CACHE_SIZE', '256'))
+
+
+class TrainingData:
+    """1つの豆の学習データ（numpy配列で保持）"""
+
+    def __init__(self, bean_name, version, X, y, feature_names, dates):
+        self.bean_name = bean_name
+        self.version = version          # (レシピ件数, 最大recipe.id)
+        self.X = X                      # 特徴量行列 (n_samples, n_features)
+        self.y = y                      # ターゲット (n_samples, 3) mesh, gram, extraction_time
+        self.feature_names = feature_names
+        self.dates = dates              # 各レシピの日付 (datetime64)
+        self.built_at = time.time()
+
+    @property
+    def sample_count(self):
+        return len(self.X)
+
+
+def _columns(rows):
+    """行のリスト（RECIPE_COLUMNS + DATE_FEATURE_COLUMNS の順）または DataFrame を列名 -> 配列にする"""
+    if hasattr(rows, 'columns'):
+        return {name: rows[name].to_numpy() for name in rows.columns}
+    names = RECIPE_COLUMNS + DATE_FEATURE_COLUMNS
+    return {name: np.asarray(values, dtype=object) for name, values in zip(names, zip(*rows))}
+
+
+def build_training_data(bean_name, version, rows):
+    """
+    recipe の行から特徴量行列を作成（pandas を使わずに numpy だけで作る）
+
+    日付の特徴量は recipe_features に保存済みの値（行の DATE_FEATURE_COLUMNS）を使い、
+    保存されていない行だけその場で計算する。天気の One-Hot は出現する天気を名前順に並べた列（pd.get_dummies と同じ）。
+
+    Args:
+        rows: RECIPE_COLUMNS の順の行のリスト（続けて DATE_FEATURE_COLUMNS があればその値を使う）、
+              または同じ列名を持つ DataFrame
+    """
+    if len(rows) == 0:
+        return TrainingData(
+            bean_name, version,
+            np.empty((0, len(NUMERICAL_COLUMNS))), np.empty((0, len(TARGET_NAMES))),
+            list(NUMERICAL_COLUMNS), np.empty(0, dtype='datetime64[ns]')
+        )
+
+    columns = _columns(rows)
+    dates = np.asarray(columns['date']).astype('datetime64[ns]')
+
+    if all(name in columns for name in DATE_FEATURE_COLUMNS):
+        parts = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in DATE_FEATURE_COLUMNS])
+        missing = np.isnan(parts).any(axis=1)
+        if missing.any():
+            parts[missing] = date_parts(dates[missing])
+    else:
+        parts = date_parts(dates)
+
+    values = dict(zip(DATE_FEATURE_COLUMNS, parts.T))
+    for name in ('temperature', 'humidity', 'days_passed'):
+        values[name] = np.asarray(columns[name], dtype=np.float64)
+
+    # 天気の One-Hot（天気が無い行は全て0）
+    weather = np.asarray(columns['weather'], dtype=object)
+    known = np.flatnonzero([isinstance(value, str) for value in weather])
+    categories, codes = np.unique(weather[known].astype(str), return_inverse=True)
+    weather_one_hot = np.zeros((len(weather), len(categories)))
+    weather_one_hot[known, codes] = 1
+
+    return TrainingData(
+        bean_name,
+        version,
+        np.column_stack([values[name] for name in NUMERICAL_COLUMNS] + [weather_one_hot]),
+        np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in TARGET_NAMES]),
+        list(NUMERICAL_COLUMNS) + [f"weather_{category}" for category in categories],
+        dates
+    )
+
+
+class TrainingDataCache:
+    """豆名をキーにした学習データのキャッシュ（LRU）"""
+
+    VERSION_QUERY = """
+    SELECT COUNT(*), MAX(r.id)
+    FROM recipe r
+    JOIN beans b ON r.bean_id = b.id
+    WHERE b.name = %s
+    """
+
+    # 日付の特徴量は recipe_features から読む（feature_store.execute_recipe_query）
+    DATA_QUERY = """
+    SELECT r.gram, r.mesh, r.extraction_time, r.date, r.weather, r.temperature, r.humidity, r.days_passed,
+           {features}
+    FROM recipe r
+    JOIN beans b ON r.bean_id = b.id
+    {join}
+    WHERE b.name = %s
+    """
+
+    def __init__(self, mysql_config, max_entries=TRAINING_DATA_CACHE_SIZE):
+        self.mysql_config = mysql_config
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bean_name):
+        """
+        豆の学習データを取得（データが変わっていなければキャッシュを返す）
+
+        Returns:
+            TrainingData
+        """
+        connection = mysql.connector.connect(**self.mysql_config)
+        # バージョンとデータを同じスナップショットから読む（間に追加された行を古いバージョンでキャッシュしない）
+        connection.start_transaction(consistent_snapshot=True, isolation_level='REPEATABLE READ', readonly=True)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(self.VERSION_QUERY, (bean_name,))
+            count, max_id = cursor.fetchone()
+            version = (int(count), max_id)
+
+            with self._lock:
+                cached = self._entries.get(bean_name)
+                if cached is not None and cached.version == version:
+                    self._entries.move_to_end(bean_name)
+                    self.hits += 1
+                    return cached
+                self.misses += 1
+
+            execute_recipe_query(cursor, self.DATA_QUERY, (bean_name,))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.rollback()
+            connection.close()
+
+        data = build_training_data(bean_name, version, rows)
+        print(f"学習データを作成しました: {bean_name} ({data.sample_count}件, version={version})")
+
+        with self._lock:
+            self._entries[bean_name] = data
+            self._entries.move_to_end(bean_name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return data
+
+    def invalidate(self, bean_name=None):
+        """キャッシュを破棄（bean_name 指定時はその豆のみ）"""
+        with self._lock:
+            if bean_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(bean_name, None)
+
+    def stats(self):
+        """キャッシュの統計情報"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+レシピの派生特徴量（日付の年・月・日・曜日）の事前計算
+
+recipe_features テーブル（migrate_schema.py が作成）に、レシピ1件につき1回だけ計算して保存する。
+    - CSVローダー（insert_data.py / insert_data_to_mysql.py）は recipe に挿入した行の特徴量を同じ接続で保存
+    - Spring Boot から追加された行は、レシピの変更確認（change_poller.py）が検出した時点で保存
+    - それ以前からある行は python feature_store.py backfill でまとめて保存
+    - Spring Boot でレシピの日付が編集された行は、保存済みの年・月・日が日付と一致しない行として
+      backfill・一括再学習（retrain_all.py）の実行時に保存し直す（recipe に更新日時の列が無いため、日付と比べて検出する）
+
+学習データの作成（feature_cache.build_training_data）は保存済みの値をそのまま使い、
+まだ保存されていない行と日付と一致しない行（結合時に NULL になる）だけその場で計算する。
+天気の One-Hot は豆ごとに出現する天気によって列が変わるため保存せず、生の値から numpy で作る。
+（recipe.id は再利用されないため、レシピが削除されて残った行は結合されないだけで害は無い）
+
+使い方:
+    python feature_store.py backfill   # 特徴量が保存されていない・日付と一致しない全ての行を保存
+"""
+
+import sys
+from datetime import date, datetime
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from db_config import get_mysql_config
+from migrate_schema import table_exists
+
+FEATURE_TABLE = 'recipe_features'
+
+# 学習データのクエリに結合する特徴量の列（クエリの {features} と {join} に埋め込む）
+# 年・月・日が日付と一致しない行（日付が編集されてまだ保存し直していない行）は結合せず NULL にする
+FEATURE_SELECT = "f.year, f.month, f.day, f.day_of_week"
+FEATURE_JOIN = ("LEFT JOIN recipe_features f ON f.recipe_id = r.id"
+                " AND f.year = YEAR(r.date) AND f.month = MONTH(r.date) AND f.day = DAYOFMONTH(r.date)")
+NULL_FEATURES = "NULL, NULL, NULL, NULL"
+
+# 保存済みの行は上書き（日付が編集された行を保存し直す）
+INSERT_QUERY = """
+INSERT INTO recipe_features (recipe_id, year, month, day, day_of_week)
+VALUES (%s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE year = VALUES(year), month = VALUES(month), day = VALUES(day), day_of_week = VALUES(day_of_week)
+"""
+
+# 特徴量が保存されていない行と、保存済みの年・月・日が日付と一致しない行（主キーの範囲で区切って読む）
+STALE_QUERY = """
+SELECT r.id, r.date
+FROM recipe r
+LEFT JOIN recipe_features f ON f.recipe_id = r.id
+WHERE r.id > %s AND r.id <= %s
+  AND (f.recipe_id IS NULL OR f.year <> YEAR(r.date) OR f.month <> MONTH(r.date) OR f.day <> DAYOFMONTH(r.date))
+ORDER BY r.id
+LIMIT %s
+"""
+
+
+def date_features(value):
+    """
+    日付から (year, month, day, day_of_week) を計算（day_of_week は月曜=0、pandas の weekday と同じ）
+
+    Args:
+        value: date / datetime / pandas.Timestamp / 'YYYY-MM-DD' 形式の文字列
+    """
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], "%Y-%m-%d")
+    elif not isinstance(value, date):
+        raise TypeError(f"日付ではありません: {value!r}")
+    return value.year, value.month, value.day, value.weekday()
+
+
+def has_feature_table(cursor):
+    """recipe_features テーブルがあるか（migrate_schema.py の実行前は無い）"""
+    return table_exists(cursor, FEATURE_TABLE)
+
+
+def execute_recipe_query(cursor, query, params=()):
+    """
+    {features} と {join} を含む recipe のクエリを、recipe_features を結合して実行
+
+    テーブルが無い場合（migrate_schema.py の実行前）は特徴量の列を NULL にして実行する
+    （行の列数は同じなので、呼び出し側は区別しなくてよい）。
+    """
+    try:
+        cursor.execute(query.format(features=FEATURE_SELECT, join=FEATURE_JOIN), params)
+    except mysql.connector.Error as e:
+        if e.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        cursor.execute(query.format(features=NULL_FEATURES, join=''), params)
+
+
+def save_features(cursor, recipe_id, value):
+    """挿入したレシピ1件の特徴量を保存（保存済みなら上書き）"""
+    cursor.execute(INSERT_QUERY, (recipe_id,) + date_features(value))
+
+
+def materialize(mysql_config, since=0, until=None, batch_size=1000):
+    """
+    recipe.id が since より大きく until 以下で、特徴量が保存されていないか日付と一致しない行の特徴量を保存
+
+    Returns:
+        int: 保存した行数（recipe_features テーブルが無い場合は0）
+    """
+    until = until if until is not None else 2 ** 31 - 1
+    saved = 0
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    try:
+        while True:
+            try:
+                cursor.execute(STALE_QUERY, (since, until, batch_size))
+            except mysql.connector.Error as e:
+                # migrate_schema.py の実行前（テーブルが無い）
+                if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                    raise
+                return saved
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(INSERT_QUERY, [(recipe_id,) + date_features(value) for recipe_id, value in rows])
+            connection.commit()
+            saved += len(rows)
+            since = rows[-1][0]
+    finally:
+        cursor.close()
+        connection.close()
+    return saved
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'backfill':
+        print(__doc__)
+        sys.exit(1)
+    saved = materialize(get_mysql_config())
+    print(f"特徴量を保存しました: {saved}件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+特徴量エンジニアリングの共通処理
+学習時と予測時で同じ列構成の特徴量行列を作るためのヘルパー
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+# 予測対象
+TARGET_NAMES = ['mesh', 'gram', 'extraction_time']
+
+# 実用上の許容誤差（正解率の評価と、ばらつきからの信頼度の計算で使う）
+TARGET_TOLERANCES = {'mesh': 0.1, 'gram': 0.3, 'extraction_time': 5.0}
+
+# 数値特徴量（列の順序はモデルの feature_names と一致させる）
+NUMERICAL_COLUMNS = ['temperature', 'humidity', 'year', 'month', 'day', 'day_of_week', 'days_passed']
+
+# recipe テーブルから取得する列
+RECIPE_COLUMNS = ['gram', 'mesh', 'extraction_time', 'date', 'weather', 'temperature', 'humidity', 'days_passed']
+
+# 日付から計算する特徴量（recipe_features テーブルに保存: feature_store.py）
+DATE_FEATURE_COLUMNS = ['year', 'month', 'day', 'day_of_week']
+
+# 豆ごとのモデルを学習するのに必要な最低データ数
+MIN_TRAINING_SAMPLES = 10
+
+# 共有モデルで使う豆の特徴量（豆ごとのターゲット平均）
+BEAN_MEAN_COLUMNS = [f'bean_{target}_mean' for target in TARGET_NAMES]
+
+
+def bean_name_to_safe(bean_name):
+    """ファイル名に使える豆名に変換"""
+    return bean_name.replace(' ', '_').replace('/', '_')
+
+
+def add_date_columns(df):
+    """date列から year/month/day/day_of_week を作成"""
+    import pandas as pd
+
+    df['date'] = pd.to_datetime(df['date'])
+    df['year'] = df['date'].dt.year
+    df['month'] = df['date'].dt.month
+    df['day'] = df['date'].dt.day
+    df['day_of_week'] = df['date'].dt.weekday
+    return df
+
+
+def date_parts(dates):
+    """
+    datetime64 の配列から year/month/day/day_of_week（月曜=0）を計算（pandas を使わない）
+
+    Returns:
+        np.ndarray: (len(dates), 4) DATE_FEATURE_COLUMNS の順。日付が無い行は NaN
+    """
+    days = np.asarray(dates).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+    parts = np.column_stack([
+        years.astype(np.int64) + 1970,
+        (months - years.astype('datetime64[M]')).astype(np.int64) + 1,
+        (days - months.astype('datetime64[D]')).astype(np.int64) + 1,
+        (days.astype(np.int64) + 3) % 7        # 1970-01-01 は木曜日
+    ]).astype(np.float64)
+    parts[np.isnat(days)] = np.nan
+    return parts
+
+
+def encode_inputs(records, feature_names, bean_target_means=None, default_bean_means=None):
+    """
+    予測入力をモデルの特徴量行列（numpy）に変換
+
+    pandas の get_dummies を使わずに、feature_names の列順で直接行列を埋める。
+    学習時に存在しなかった天気・産地は全て0（既存の予測処理と同じ扱い）。
+
+    Args:
+        records: 入力のリスト（date, weather, temperature, humidity, days_passed,
+                 bean_origin, bean_name を持つ dict）
+        feature_names: モデルの特徴量名（順序付き）
+        bean_target_means: 豆名 -> ターゲット平均のタプル（共有モデル用）
+        default_bean_means: 未知の豆に使うターゲット平均（共有モデル用）
+
+    Returns:
+        np.ndarray: (len(records), len(feature_names)) の特徴量行列
+    """
+    column_index = {name: i for i, name in enumerate(feature_names)}
+    X = np.zeros((len(records), len(feature_names)), dtype=np.float64)
+
+    numeric_index = [(name, column_index[name]) for name in ('temperature', 'humidity', 'days_passed') if name in column_index]
+    date_index = [(name, column_index[name]) for name in ('year', 'month', 'day', 'day_of_week') if name in column_index]
+    bean_mean_index = [column_index[name] for name in BEAN_MEAN_COLUMNS if name in column_index]
+
+    for row, record in enumerate(records):
+        for name, col in numeric_index:
+            value = record.get(name)
+            X[row, col] = np.nan if value is None else value
+
+        if date_index:
+            date_obj = datetime.strptime(record['date'], "%Y-%m-%d")
+            date_values = {
+                'year': date_obj.year,
+                'month': date_obj.month,
+                'day': date_obj.day,
+                'day_of_week': date_obj.weekday()
+            }
+            for name, col in date_index:
+                X[row, col] = date_values[name]
+
+        col = column_index.get(f"weather_{record.get('weather')}")
+        if col is not None:
+            X[row, col] = 1
+        col = column_index.get(f"origin_{record.get('bean_origin')}")
+        if col is not None:
+            X[row, col] = 1
+
+        if bean_mean_index:
+            means = (bean_target_means or {}).get(record.get('bean_name'), default_bean_means)
+            for col, value in zip(bean_mean_index, means):
+                X[row, col] = value
+
+    return X
+
+
+def as_model_input(model, X, feature_names):
+    """列名付きで学習したモデルにはDataFrameで渡す（sklearnの警告を避けるため）"""
+    if hasattr(model, 'feature_names_in_'):
+        import pandas as pd
+        return pd.DataFrame(X, columns=feature_names)
+    return X
+
+
+def encode_grid(base_record, feature_names, numeric_values, weathers, bean_target_means=None, default_bean_means=None):
+    """
+    数値特徴量の値の組み合わせ × 天気 の直積を1つの特徴量行列にする
+
+    Args:
+        base_record: 共通の入力（bean_name, bean_origin, date など）
+        feature_names: モデルの特徴量名（順序付き）
+        numeric_values: 数値特徴量名 -> 値の配列（temperature, humidity, days_passed）
+        weathers: 天気のリスト
+
+    Returns:
+        tuple: (特徴量行列, グリッドの各列（特徴量名 -> 行ごとの値）)
+    """
+    names = list(numeric_values)
+    axes = [np.asarray(numeric_values[name], dtype=np.float64) for name in names]
+    axes.append(np.arange(len(weathers)))
+    mesh = [axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')]
+    weather_index = mesh.pop().astype(int)
+    n_points = len(weather_index)
+
+    # 共通部分（日付・産地・豆の特徴量）は1行だけエンコードして複製
+    base = encode_inputs([dict(base_record, weather=None)], feature_names, bean_target_means, default_bean_means)
+    X = np.repeat(base, n_points, axis=0)
+
+    column_index = {name: i for i, name in enumerate(feature_names)}
+    for name, values in zip(names, mesh):
+        if name in column_index:
+            X[:, column_index[name]] = values
+
+    # 天気のOne-Hot（学習時に無かった天気は全て0）
+    weather_columns = np.array([column_index.get(f"weather_{w}", -1) for w in weathers])
+    row_columns = weather_columns[weather_index]
+    known = row_columns >= 0
+    X[np.flatnonzero(known), row_columns[known]] = 1
+
+    grid = dict(zip(names, mesh))
+    grid['weather'] = [weathers[i] for i in weather_index]
+    return X, grid
@@ -0,0 +1,150 @@
+"""
+RandomForest の各木の予測に関するヘルパー
+
+木ごとに predict を呼ぶ代わりに、model.apply() で全ての木の葉の番号をまとめて取得し、
+全ての木の葉の値を1つにまとめた表から一度に引く。
+この1回の計算から予測値（木の平均）・ばらつき（標準偏差）・予測区間（木の予測の分位点）を求める。
+オンライン更新の補正を持つモデル（online_model.OnlineForest）は、元の森の各木の予測を補正分ずらす。
+CompactForest（compact_forest.py）は自身の葉の値の表を使う。
+"""
+
+import math
+import os
+import threading
+import weakref
+
+import numpy as np
+
+from features import TARGET_TOLERANCES
+
+# 予測区間を計算するかどうか（true / false）
+PREDICTION_INTERVALS_ENABLED = os.getenv('PREDICTION_INTERVALS_ENABLED', 'true').lower() == 'true'
+
+# 予測区間に含める木の予測の割合（0.8 の場合は 10% 〜 90% 分位点）
+PREDICTION_INTERVAL_COVERAGE = float(os.getenv('PREDICTION_INTERVAL_COVERAGE', '0.8'))
+
+# 信頼度の範囲（calculate_model_confidence と同じ）
+MIN_CONFIDENCE = 0.3
+MAX_CONFIDENCE = 0.95
+
+# モデル -> 葉の値の表（モデルが破棄されたら表も破棄）
+_leaf_tables = weakref.WeakKeyDictionary()
+_leaf_tables_lock = threading.Lock()
+
+
+def leaf_value_table(model):
+    """
+    全ての木のノードの値を1つの配列にまとめた表（モデルごとに1回だけ作成）
+
+    Returns:
+        tuple: (ノードの値 (全ノード数, ターゲット数), 各木の先頭の位置 (木の数,))。木の集合でないモデルの場合はNone
+    """
+    if hasattr(model, 'leaf_value_table'):
+        return model.leaf_value_table()
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None or not hasattr(model, 'apply'):
+        return None
+
+    with _leaf_tables_lock:
+        table = _leaf_tables.get(model)
+        if table is None:
+            values = [estimator.tree_.value[:, :, 0] for estimator in estimators]
+            offsets = np.cumsum([0] + [len(v) for v in values[:-1]]).astype(np.intp)
+            table = (np.concatenate(values), offsets)
+            _leaf_tables[model] = table
+        return table
+
+
+def tree_predictions(model, X):
+    """
+    各木の予測をまとめて取得（apply と表の参照の1回の計算）
+
+    Returns:
+        np.ndarray: (木の数, 行数, ターゲット数)。木の集合でないモデルの場合はNone
+    """
+    correction = getattr(model, 'correction', None)
+    model = getattr(model, 'base', model)
+    table = leaf_value_table(model)
+    if table is None:
+        return None
+    values, offsets = table
+    leaves = model.apply(X)                     # (行数, 木の数)
+    predictions = values[leaves + offsets].transpose(1, 0, 2)
+    if correction is not None:
+        predictions = predictions + correction.predict(np.asarray(X))
+    return predictions
+
+
+def tree_dispersion(model, X):
+    """
+    各木の予測の標準偏差（予測のばらつき）
+
+    Returns:
+        np.ndarray: (行数, ターゲット数)。木の集合でないモデルの場合はNone
+    """
+    predictions = tree_predictions(model, X)
+    if predictions is None:
+        return None
+    return predictions.std(axis=0)
+
+
+def predict_with_intervals(model, X, coverage=PREDICTION_INTERVAL_COVERAGE):
+    """
+    予測値・ばらつき・予測区間を1回の計算で取得
+
+    予測区間は木の予測の順位で決める（100本の木で coverage=0.8 の場合は下から10番目と90番目付近）。
+    補間のある np.percentile より速い np.partition を木の軸が連続した配列に対して使う。
+
+    Returns:
+        dict: mean / std / lower / upper（それぞれ (行数, ターゲット数)）。木の集合でないモデルの場合はNone
+    """
+    correction = getattr(model, 'correction', None)
+    model = getattr(model, 'base', model)
+    table = leaf_value_table(model)
+    if table is None:
+        return None
+    values, offsets = table
+    leaves = model.apply(X)
+    # (行数, ターゲット数, 木の数)
+    predictions = np.ascontiguousarray(values[leaves + offsets].transpose(0, 2, 1))
+    if correction is not None:
+        predictions += correction.predict(np.asarray(X))[:, :, np.newaxis]
+
+    n_trees = predictions.shape[-1]
+    tail = (1.0 - coverage) / 2
+    low = int(math.floor(tail * (n_trees - 1)))
+    high = int(math.ceil((1.0 - tail) * (n_trees - 1)))
+    ranked = np.partition(predictions, [low, high], axis=-1)
+    return {
+        'mean': predictions.mean(axis=-1),
+        'std': predictions.std(axis=-1),
+        'lower': ranked[..., low],
+        'upper': ranked[..., high]
+    }
+
+
+def dispersion_confidence(std, target_names):
+    """
+    木の予測のばらつきから信頼度を計算
+
+    各ターゲットについて、予測誤差が木のばらつきの正規分布に従うとしたときに
+    許容誤差（TARGET_TOLERANCES）以内に収まる確率を求め、その平均を信頼度とする。
+
+    Returns:
+        np.ndarray: (行数,) の信頼度（MIN_CONFIDENCE 〜 MAX_CONFIDENCE）
+    """
+    tolerances = np.array([TARGET_TOLERANCES[name] for name in target_names])
+    z = tolerances / (np.maximum(std, 1e-9) * math.sqrt(2))
+    within = np.vectorize(math.erf)(z)
+    return np.clip(within.mean(axis=1), MIN_CONFIDENCE, MAX_CONFIDENCE)
+
+
+def interval_fields(result, row, target_names):
+    """1行分の予測区間とばらつきをレスポンス用のdictにする"""
+    return {
+        'intervals': {
+            name: [float(result['lower'][row, i]), float(result['upper'][row, i])]
+            for i, name in enumerate(target_names)
+        },
+        'dispersion': {name: float(result['std'][row, i]) for i, name in enumerate(target_names)}
+    }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+全ての豆のレシピで学習する共有モデル
+豆ごとのモデルが無い豆（データが少ない新しい豆など）の予測に使う
+
+豆の情報は「豆ごとのターゲット平均」（データが少ない豆は全体平均に寄せる）、
+産地の情報は origin_* のOne-Hot列として特徴量に含める。
+モデルと前処理情報はモデルストアに GLOBAL_MODEL_KEY の名前で保存する
+（従来の model/global_model.pkl も読み込める）。
+"""
+
+import os
+import pickle
+from datetime import datetime
+
+import mysql.connector
+
+from db_config import get_mysql_config
+from features import (
+    BEAN_MEAN_COLUMNS, NUMERICAL_COLUMNS, RECIPE_COLUMNS, TARGET_NAMES, add_date_columns
+)
+from model_store import GLOBAL_MODEL_KEY, ModelStore
+
+GLOBAL_MODEL_FILE = 'model/global_model.pkl'
+
+# off: 共有モデルを使わない / on: 豆ごとのモデルが無い豆は共有モデルで予測
+GLOBAL_MODEL_MODE = os.getenv('GLOBAL_MODEL_MODE', 'off')
+
+# 共有モデル使用時、このサンプル数以上の豆ごとのモデルだけを読み込む（メモリ節約用）
+GLOBAL_MODEL_OVERRIDE_MIN_SAMPLES = int(os.getenv('GLOBAL_MODEL_OVERRIDE_MIN_SAMPLES', '10'))
+
+# 豆ごとのターゲット平均を全体平均に寄せる強さ（仮想サンプル数）
+BEAN_MEAN_SMOOTHING = 5.0
+
+
+def is_enabled():
+    """共有モデルモードが有効かどうか"""
+    return GLOBAL_MODEL_MODE == 'on'
+
+
+def fetch_all_recipes(mysql_config):
+    """全ての豆のレシピデータを取得"""
+    import pandas as pd
+
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+
+    query = """
+    SELECT r.gram, r.mesh, r.extraction_time, r.date, r.weather, r.temperature, r.humidity, r.days_passed,
+           b.name, b.from_location
+    FROM recipe r
+    JOIN beans b ON r.bean_id = b.id
+    """
+
+    cursor.execute(query)
+    rows = cursor.fetchall()
+    cursor.close()
+    connection.close()
+
+    return pd.DataFrame(rows, columns=RECIPE_COLUMNS + ['bean_name', 'bean_origin'])
+
+
+def train_global_model(df):
+    """
+    全レシピから共有モデルを学習
+
+    Args:
+        df: fetch_all_recipes() の結果
+
+    Returns:
+        dict: {'model': 学習済みモデル, 'preprocessing_info': 前処理情報}
+    """
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+
+    df = add_date_columns(df.copy())
+    y = df[TARGET_NAMES]
+
+    # 豆ごとのターゲット平均（平滑化あり）
+    prior = y.mean()
+    grouped = df.groupby('bean_name')[TARGET_NAMES]
+    sums = grouped.transform('sum')
+    counts = grouped.transform('count')
+
+    # 学習時は自分の行を除いた平均を使う（リーク防止）
+    loo_means = (sums - y + BEAN_MEAN_SMOOTHING * prior) / (counts - 1 + BEAN_MEAN_SMOOTHING)
+    loo_means.columns = BEAN_MEAN_COLUMNS
+
+    X = pd.concat([df[NUMERICAL_COLUMNS], loo_means], axis=1)
+
+    weather_dummies = pd.get_dummies(df['weather'], prefix='weather')
+    origin_dummies = pd.get_dummies(df['bean_origin'], prefix='origin')
+    X = pd.concat([X, weather_dummies, origin_dummies], axis=1).astype(float)
+
+    print(f"共有モデル学習: 特徴量数: {X.shape[1]}, サンプル数: {X.shape[0]}, 豆の数: {df['bean_name'].nunique()}")
+
+    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    model.fit(X.values, y.values)
+
+    # 予測時は全データでの平均を使う
+    bean_sums = grouped.sum()
+    bean_counts = grouped.count()
+    bean_means = (bean_sums + BEAN_MEAN_SMOOTHING * prior) / (bean_counts + BEAN_MEAN_SMOOTHING)
+
+    preprocessing_info = {
+        'feature_names': list(X.columns),
+        'target_names': TARGET_NAMES,
+        'categorical_columns': ['weather', 'bean_origin'],
+        'numerical_columns': NUMERICAL_COLUMNS + BEAN_MEAN_COLUMNS,
+        'data_source': 'mysql_demo_db',
+        'bean_name': None,
+        'training_date': datetime.now().isoformat(),
+        'sample_count': len(X),
+        'bean_count': int(df['bean_name'].nunique()),
+        'bean_target_means': {name: tuple(float(v) for v in row) for name, row in bean_means.iterrows()},
+        'default_bean_means': tuple(float(v) for v in prior)
+    }
+
+    return {'model': model, 'preprocessing_info': preprocessing_info}
+
+
+def save_global_model(artifact, store=None):
+    """共有モデルをモデルストアに新しいバージョンとして公開"""
+    store = store or ModelStore()
+    version = store.publish(GLOBAL_MODEL_KEY, artifact['model'], artifact['preprocessing_info'])
+    print(f"共有モデルを保存しました: {store.version_dir(GLOBAL_MODEL_KEY, version)}")
+    return version
+
+
+def load_global_model(store=None, path=GLOBAL_MODEL_FILE):
+    """共有モデルを読み込み（モデルストアに無ければ従来の1ファイル形式、どちらも無い場合はNone）"""
+    store = store or ModelStore()
+    loaded = store.load(GLOBAL_MODEL_KEY)
+    if loaded is not None:
+        model, preprocessing_info, _ = loaded
+        artifact = {'model': model, 'preprocessing_info': preprocessing_info}
+    else:
+        try:
+            with open(path, 'rb') as f:
+                artifact = pickle.load(f)
+        except FileNotFoundError:
+            print("共有モデルファイルが見つかりません")
+            return None
+    print(f"共有モデルを読み込みました: {artifact['preprocessing_info']['sample_count']}件のデータで学習")
+    return artifact
+
+
+def main():
+    """共有モデルを学習して保存"""
+    df = fetch_all_recipes(get_mysql_config())
+    if len(df) == 0:
+        print("❌ レシピデータがありません")
+        return
+    artifact = train_global_model(df)
+    save_global_model(artifact)
+
+
+if __name__ == "__main__":
+    main()
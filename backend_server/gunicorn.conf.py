@@ -0,0 +1,41 @@
+"""
+gunicorn の設定（複数ワーカーでの起動）
+
+    gunicorn -c gunicorn.conf.py app_mysql:app
+
+PRELOAD_MODELS=true（デフォルト）の場合はマスタープロセスでアプリとモデルを1回だけ読み込んでから fork する。
+読み込み済みのモデル（木の配列）はワーカー間でコピーオンライトで共有され、ワーカー数を増やしてもモデルの分のメモリは増えない。
+fork の前に gc.freeze() で読み込み済みのオブジェクトをGCの対象から外し、
+ワーカーのGCがオブジェクトのヘッダーを書き換えて共有ページがコピーされるのを防ぐ。
+
+起動後にホットリロードで読み込んだモデルはワーカーごとに持つため、共有されるのは起動時に読み込んだモデルだけ。
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8081')}"
+
+# ワーカー数（1の場合は従来の uvicorn 1プロセスと同じ）
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# マスターでアプリを読み込んでから fork する（モデルのメモリを共有）
+preload_app = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'
+
+# 動的学習は数秒かかることがあるため長めにする
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    server.log.info(f"ワーカー起動: pid={worker.pid} (preload_app={preload_app})")
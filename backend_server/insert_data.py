@@ -7,36 +7,15 @@ insert_data_to_mysql.pyと同じCSVデータのみを挿入
 
 import os
 import sys
-import time
 import mysql.connector
 from mysql.connector import Error
 import pandas as pd
 import glob
 from datetime import datetime, timedelta
 
-def wait_for_spring_boot_completion(max_retries=60, retry_interval=5):
-    """Spring Bootの起動完了を待機"""
-    print("⏳ Spring Bootの起動完了を待機中...")
-    
-    for attempt in range(max_retries):
-        try:
-            # Spring Bootのヘルスチェック
-            import requests
-            response = requests.get("http://springboot:8080/", timeout=5)
-            if response.status_code == 200:
-                print("✅ Spring Bootが起動完了しました！")
-                return True
-        except Exception as e:
-            print(f"Spring Boot接続エラー: {e}")
-        except:
-            pass
-        
-        print(f"⏳ 試行 {attempt + 1}/{max_retries}: Spring Boot起動待機中...")
-        if attempt < max_retries - 1:
-            time.sleep(retry_interval)
-    
-    print("❌ Spring Boot起動タイムアウト")
-    return False
+from feature_store import has_feature_table, materialize, save_features
+from migrate_schema import has_unique_recipe_key, migrate
+from readiness import wait_for_initial_data
 
 def get_mysql_config():
     """MySQL接続設定を取得"""
@@ -286,6 +265,15 @@ def insert_csv_data():
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
         
+        # ユニークキーがある場合は INSERT IGNORE に重複判定を任せ、行ごとの重複チェックを省略
+        use_insert_ignore = has_unique_recipe_key(cursor)
+        if use_insert_ignore:
+            print("ℹ️  ユニークキー uk_recipe_bean_date_time を使って重複を除外します")
+            insert_query = insert_query.replace("INSERT INTO", "INSERT IGNORE INTO")
+        
+        # 挿入した行の日付の特徴量も保存（テーブルが無ければ後で feature_store.py backfill で保存）
+        use_feature_table = has_feature_table(cursor)
+        
         inserted_count = 0
         skipped_count = 0
         
@@ -299,16 +287,18 @@ def insert_csv_data():
                     bean_id = bean_result[0]
                     
                     # 重複チェック: 同じbean_id、日付、抽出時間の組み合わせが既に存在するかチェック
-                    check_query = """
-                    SELECT COUNT(*) FROM recipe 
-                    WHERE bean_id = %s AND date = %s AND extraction_time = %s
-                    """
-                    cursor.execute(check_query, (
-                        bean_id,
-                        row['date'].strftime('%Y-%m-%d'),
-                        row['extraction_time']
-                    ))
-                    duplicate_count = cursor.fetchone()[0]
+                    duplicate_count = 0
+                    if not use_insert_ignore:
+                        check_query = """
+                        SELECT COUNT(*) FROM recipe 
+                        WHERE bean_id = %s AND date = %s AND extraction_time = %s
+                        """
+                        cursor.execute(check_query, (
+                            bean_id,
+                            row['date'].strftime('%Y-%m-%d'),
+                            row['extraction_time']
+                        ))
+                        duplicate_count = cursor.fetchone()[0]
                     
                     if duplicate_count == 0:
                         # データを挿入
@@ -323,6 +313,12 @@ def insert_csv_data():
                             row['extraction_time'],
                             row['days_passed']
                         ))
+                        # INSERT IGNORE で重複が無視された場合は rowcount が0
+                        duplicate_count = 1 - cursor.rowcount
+                        if duplicate_count == 0 and use_feature_table:
+                            save_features(cursor, cursor.lastrowid, row['date'])
+                    
+                    if duplicate_count == 0:
                         inserted_count += 1
                     else:
                         skipped_count += 1
@@ -353,9 +349,9 @@ def main():
     print("=== CSVデータ挿入スクリプト デバッグ開始 ===")
     print("🚀 CSVデータ挿入スクリプトを開始...")
     
-    # Spring Bootの起動完了を待機
-    if not wait_for_spring_boot_completion():
-        print("⚠️  Spring Bootの起動を待機できませんでしたが、続行します")
+    # DataInitializer が beans テーブルにデータを入れ終わるまで待機（Spring Boot の応答も並行して確認）
+    if not wait_for_initial_data(get_mysql_config()):
+        print("⚠️  データの準備完了を待機できませんでしたが、続行します")
     
     # 既存データを確認
     print("\n📊 既存データの確認中...")
@@ -369,6 +365,19 @@ def main():
     
     print("✅ ユーザーとコーヒー豆のデータが確認されました")
     
+    # インデックスとユニークキーを作成（作成済みなら何もしない）
+    print("\n🔧 インデックスの確認中...")
+    try:
+        migrate(get_mysql_config())
+    except Error as e:
+        print(f"⚠️  インデックスの作成に失敗しましたが、続行します: {e}")
+
+    # Spring Boot が挿入した行など、特徴量が保存されていない行の特徴量を保存
+    try:
+        print(f"✅ 日付の特徴量を保存しました: {materialize(get_mysql_config())}件")
+    except Error as e:
+        print(f"⚠️  日付の特徴量を保存できませんでしたが、続行します: {e}")
+    
     # CSVデータを挿入
     print("\n📝 CSVデータを挿入します...")
     inserted_count = insert_csv_data()
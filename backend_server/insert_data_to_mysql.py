@@ -5,6 +5,8 @@ import os
 import glob
 from typing import List, Dict
 
+from feature_store import has_feature_table, save_features
+
 class DataInserter:
     def __init__(self):
         # MySQL接続設定
@@ -198,6 +200,9 @@ class DataInserter:
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             
+            # 挿入した行の日付の特徴量も保存（テーブルが無ければ後で feature_store.py backfill で保存）
+            use_feature_table = has_feature_table(cursor)
+            
             inserted_count = 0
             skipped_count = 0
             
@@ -235,6 +240,8 @@ class DataInserter:
                                 row['extraction_time'],
                                 row['days_passed']
                             ))
+                            if use_feature_table:
+                                save_features(cursor, cursor.lastrowid, row['date'])
                             inserted_count += 1
                         else:
                             skipped_count += 1
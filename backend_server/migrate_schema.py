@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+スキーマ移行ツール（インデックスの作成と確認）
+
+テーブル自体は Spring Boot の JPA（ddl-auto=update）が作成するため、
+ここではバックエンドの主要なクエリが使うインデックスと、バックエンドだけが使うテーブル
+（recipe_features: feature_store.py）を管理する。
+
+使い方:
+    python migrate_schema.py migrate   # 不足しているインデックスを作成（何度実行しても同じ結果）
+    python migrate_schema.py verify    # 不足しているインデックスとクエリの実行計画を表示
+"""
+
+import sys
+
+import mysql.connector
+
+from db_config import get_mysql_config
+
+# バックエンドが管理するテーブル（JPA のエンティティが無いもの）
+TABLES = [
+    {
+        'name': 'recipe_features',
+        'create': """
+        CREATE TABLE IF NOT EXISTS recipe_features (
+            recipe_id INT NOT NULL PRIMARY KEY,
+            year SMALLINT NOT NULL,
+            month TINYINT NOT NULL,
+            day TINYINT NOT NULL,
+            day_of_week TINYINT NOT NULL
+        )
+        """,
+        'description': 'レシピの日付から計算した特徴量（feature_store.py）'
+    },
+]
+
+# 管理するインデックス
+# fallback: ユニークキーが既存の重複データで作成できない場合に代わりに作る通常インデックス
+INDEXES = [
+    {
+        'table': 'beans',
+        'name': 'idx_beans_name',
+        'columns': ['name'],
+        'unique': False,
+        'description': '豆名での検索・JOIN用'
+    },
+    {
+        'table': 'recipe',
+        'name': 'uk_recipe_bean_date_time',
+        'columns': ['bean_id', 'date', 'extraction_time'],
+        'unique': True,
+        'fallback': 'idx_recipe_bean_date_time',
+        'description': 'bean_id での絞り込みと重複チェック用（ローダーの INSERT IGNORE が依存）'
+    },
+]
+
+# 実行計画を確認するアプリのクエリ（ラベル, SQL, パラメータ）
+HOT_QUERIES = [
+    (
+        '豆ごとの学習データ取得',
+        """
+        SELECT r.gram, r.mesh, r.extraction_time, r.date, r.weather, r.temperature, r.humidity, r.days_passed,
+               f.year, f.month, f.day, f.day_of_week
+        FROM recipe r
+        JOIN beans b ON r.bean_id = b.id
+        LEFT JOIN recipe_features f ON f.recipe_id = r.id
+        WHERE b.name = %s
+        """,
+        ('エチオピア イルガチェフェ',)
+    ),
+    (
+        '学習データのバージョン確認',
+        """
+        SELECT COUNT(*), MAX(r.id)
+        FROM recipe r
+        JOIN beans b ON r.bean_id = b.id
+        WHERE b.name = %s
+        """,
+        ('エチオピア イルガチェフェ',)
+    ),
+    (
+        'CSV挿入時の重複チェック',
+        """
+        SELECT COUNT(*) FROM recipe
+        WHERE bean_id = %s AND date = %s AND extraction_time = %s
+        """,
+        (1, '2024-11-02', 28)
+    ),
+    (
+        'レシピの追加の確認（主キーの範囲のみ）',
+        """
+        SELECT b.name, COUNT(*), MAX(r.id)
+        FROM recipe r
+        JOIN beans b ON r.bean_id = b.id
+        WHERE r.id > %s
+        GROUP BY b.name
+        """,
+        (0,)
+    ),
+    (
+        '豆名からbean_idを取得',
+        "SELECT id FROM beans WHERE name = %s",
+        ('エチオピア イルガチェフェ',)
+    ),
+]
+
+
+def table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def get_existing_indexes(cursor, table):
+    """テーブルの既存インデックスを取得（インデックス名 -> (列のタプル, ユニークかどうか)）"""
+    cursor.execute("""
+        SELECT index_name, column_name, non_unique
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY index_name, seq_in_index
+    """, (table,))
+
+    indexes = {}
+    for index_name, column_name, non_unique in cursor.fetchall():
+        columns, unique = indexes.get(index_name, ((), not non_unique))
+        indexes[index_name] = (columns + (column_name,), unique)
+    return indexes
+
+
+def find_index(existing, spec):
+    """
+    仕様を満たす既存インデックスを探す（名前ではなく列構成で判定）
+
+    Returns:
+        str: 見つかったインデックス名（ユニーク指定の場合はユニークなもののみ）。なければNone
+    """
+    for index_name, (columns, unique) in existing.items():
+        if list(columns) == spec['columns'] and (unique or not spec['unique']):
+            return index_name
+    return None
+
+
+def count_duplicates(cursor, spec):
+    """ユニークキーの列で重複しているグループ数を数える"""
+    columns = ', '.join(spec['columns'])
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM {spec['table']} GROUP BY {columns} HAVING COUNT(*) > 1
+        ) d
+    """)
+    return cursor.fetchone()[0]
+
+
+def has_unique_recipe_key(cursor):
+    """recipe の重複防止ユニークキーが存在するか（ローダーが INSERT IGNORE を使えるか）"""
+    spec = next(s for s in INDEXES if s['name'] == 'uk_recipe_bean_date_time')
+    return find_index(get_existing_indexes(cursor, spec['table']), spec) is not None
+
+
+def migrate(mysql_config):
+    """
+    不足しているテーブルとインデックスを作成（冪等）
+
+    Returns:
+        list: 作成したテーブル名・インデックス名
+    """
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    created = []
+
+    try:
+        for spec in TABLES:
+            if table_exists(cursor, spec['name']):
+                print(f"✅ テーブル {spec['name']} は作成済み")
+                continue
+            print(f"🔧 作成中: テーブル {spec['name']}")
+            cursor.execute(spec['create'])
+            created.append(spec['name'])
+
+        for spec in INDEXES:
+            existing = get_existing_indexes(cursor, spec['table'])
+            if not existing:
+                print(f"⚠️  テーブル {spec['table']} が見つかりません（Spring Bootの起動後に再実行してください）")
+                continue
+
+            found = find_index(existing, spec)
+            if found:
+                print(f"✅ {spec['table']}.{found} は作成済み")
+                continue
+
+            name = spec['name']
+            unique = spec['unique']
+            if unique:
+                duplicates = count_duplicates(cursor, spec)
+                if duplicates > 0:
+                    print(f"⚠️  {spec['table']} に重複データが {duplicates} グループあるため、ユニークキーの代わりに通常インデックスを作成します")
+                    name = spec['fallback']
+                    unique = False
+                    if find_index(existing, dict(spec, unique=False)):
+                        print(f"✅ {spec['table']}.{name} は作成済み")
+                        continue
+
+            columns = ', '.join(spec['columns'])
+            kind = 'UNIQUE INDEX' if unique else 'INDEX'
+            print(f"🔧 作成中: {spec['table']}.{name} ({columns})")
+            cursor.execute(f"ALTER TABLE {spec['table']} ADD {kind} {name} ({columns})")
+            created.append(name)
+
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+    print(f"スキーマ移行完了: {len(created)}件作成")
+    return created
+
+
+def verify(mysql_config, explain=True):
+    """
+    テーブルとインデックスの状態を確認し、主要クエリの実行計画を表示
+
+    Returns:
+        list: 不足しているテーブル名・インデックス名
+    """
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    missing = []
+
+    try:
+        print("=== テーブルの状態 ===")
+        for spec in TABLES:
+            if table_exists(cursor, spec['name']):
+                print(f"  ✅ {spec['name']} - {spec['description']}")
+            else:
+                print(f"  ❌ {spec['name']} がありません - {spec['description']}")
+                missing.append(spec['name'])
+
+        print("=== インデックスの状態 ===")
+        for spec in INDEXES:
+            existing = get_existing_indexes(cursor, spec['table'])
+            found = find_index(existing, spec)
+            columns = ', '.join(spec['columns'])
+            if found:
+                print(f"  ✅ {spec['table']}.{found} ({columns}) - {spec['description']}")
+            elif spec.get('fallback') and find_index(existing, dict(spec, unique=False)):
+                print(f"  ⚠️  {spec['table']}.{spec['name']} ({columns}) はユニークではありません（重複データあり）")
+                missing.append(spec['name'])
+            else:
+                print(f"  ❌ {spec['table']}.{spec['name']} ({columns}) がありません - {spec['description']}")
+                missing.append(spec['name'])
+
+        if explain:
+            print()
+            print("=== 主要クエリの実行計画 ===")
+            for label, query, params in HOT_QUERIES:
+                print(f"--- {label} ---")
+                cursor.execute("EXPLAIN " + query, params)
+                columns = [d[0] for d in cursor.description]
+                for row in cursor.fetchall():
+                    plan = dict(zip(columns, row))
+                    print(f"  table={plan.get('table')} type={plan.get('type')} key={plan.get('key')} "
+                          f"rows={plan.get('rows')} extra={plan.get('Extra')}")
+    finally:
+        cursor.close()
+        connection.close()
+
+    return missing
+
+
+def main():
+    """メイン関数"""
+    command = sys.argv[1] if len(sys.argv) > 1 else 'verify'
+    mysql_config = get_mysql_config()
+
+    if command == 'migrate':
+        migrate(mysql_config)
+        missing = verify(mysql_config, explain=False)
+    elif command == 'verify':
+        missing = verify(mysql_config)
+    else:
+        print(f"使い方: python {sys.argv[0]} [migrate|verify]")
+        sys.exit(2)
+
+    if missing:
+        print(f"❌ 不足しているテーブル・インデックス: {', '.join(missing)}")
+        sys.exit(1)
+    print("✅ 全てのテーブル・インデックスが揃っています")
+
+
+if __name__ == "__main__":
+    main()
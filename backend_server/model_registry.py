@@ -0,0 +1,264 @@
+"""
+予測に使うモデルの集合（ワーカーごと）と、モデルストアの変更の反映
+
+各ワーカーはバックグラウンドスレッドでモデルストアの変更履歴（changes.log）を
+MODEL_RELOAD_INTERVAL_SECONDS ごとに確認し、新しく公開されたバージョンだけを読み込む。
+読み込みが終わったら ModelSet を丸ごと差し替えるため、リクエスト側はロックもディスクの確認も不要。
+
+CURRENT に対するオンライン更新の補正（online_model.py）がある豆は、元のモデルと補正を合わせた
+OnlineForest を「<バージョン>+<更新回数>」のバージョンとして読み込む。
+COMPACT_FORESTS_ENABLED=true の場合、豆ごとの森は CompactForest（compact_forest.py）にしてから保持する。
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import global_model
+from compact_forest import COMPACT_FORESTS_ENABLED, CompactForest, is_forest
+from model_store import GLOBAL_MODEL_KEY, load_legacy_models_info
+from online_model import ONLINE_UPDATES_ENABLED, OnlineForest
+
+# 変更履歴を確認する間隔（秒）。別のワーカーで学習したモデルはこの時間以内に反映される
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.getenv('MODEL_RELOAD_INTERVAL_SECONDS', '2'))
+
+LoadedModel = namedtuple('LoadedModel', ['model', 'preprocessing_info', 'version'])
+
+
+def base_version(version):
+    """オンライン更新の回数を除いたモデルストアのバージョン"""
+    return version.split('+', 1)[0] if version else version
+
+
+class ModelSet:
+    """ある時点のモデルの集合（読み取り専用。更新時は新しい ModelSet を作る）"""
+
+    def __init__(self, beans=None, shared=None):
+        self.beans = beans or {}        # 豆名 -> LoadedModel
+        self.shared = shared            # 共有モデル {'model', 'preprocessing_info', 'version'} またはNone
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """モデルストアから読み込んだモデルの集合と、その更新"""
+
+    def __init__(self, store, interval=MODEL_RELOAD_INTERVAL_SECONDS, load=True):
+        """
+        Args:
+            load: False の場合は空の状態で作成し、load() で読み込む（STARTUP_MODE=lazy のウォームアップ用）
+        """
+        self.store = store
+        self.interval = interval
+        self.listeners = []             # 差し替え後に呼ぶ関数（元のモデルが変更された豆名のリストを受け取る）
+        self.reloads = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._changes_offset = 0
+        self._changes_inode = None
+
+        self.current = ModelSet()
+        if load:
+            self.load()
+
+    def load(self):
+        """モデルストアの現在のバージョンを全て読み込む"""
+        self._sync_changes_position()
+        self.current = self._load_all()
+
+    def _sync_changes_position(self):
+        """変更履歴の末尾を記録（これ以降の変更を監視する）"""
+        try:
+            stat = os.stat(self.store.changes_path)
+            self._changes_offset, self._changes_inode = stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            self._changes_offset, self._changes_inode = 0, None
+
+    def _accepts(self, sample_count):
+        # 共有モデルモードではデータが十分な豆のモデルだけを読み込む
+        return not global_model.is_enabled() or sample_count >= global_model.GLOBAL_MODEL_OVERRIDE_MIN_SAMPLES
+
+    def _load_all(self):
+        """モデルストアの現在のバージョンを全て読み込み、ストアに無い豆は従来の pickle ファイルから読み込む"""
+        sample_counts = {}
+        for bean_name, info in load_legacy_models_info().items():
+            sample_counts[bean_name] = info.get('sample_count', 0)
+        for bean_name in self.store.bean_names():
+            versions = self.store.versions(bean_name)
+            sample_counts[bean_name] = (versions[-1].get('sample_count') if versions else None) or 0
+
+        beans = {}
+        for bean_name, sample_count in sample_counts.items():
+            if not self._accepts(sample_count):
+                print(f"{bean_name}は共有モデルで予測します（サンプル数: {sample_count}）")
+                continue
+            try:
+                loaded = self.store.load_with_legacy(bean_name)
+                if loaded is None:
+                    continue
+                beans[bean_name] = self._with_online(bean_name, self._compact(bean_name, LoadedModel(*loaded)))
+                print(f"{bean_name}の保存済みモデルを読み込みました ({loaded[2]})")
+            except Exception as e:
+                print(f"{bean_name}のモデル読み込みに失敗: {e}")
+
+        if beans:
+            print(f"保存済みモデル読み込み完了: {len(beans)}個のモデル")
+        else:
+            print("保存済みモデルファイルが見つかりません。動的モデル作成を使用します。")
+
+        shared = self._load_shared() if global_model.is_enabled() else None
+        return ModelSet(beans, shared)
+
+    def _compact(self, bean_name, loaded):
+        """
+        森を CompactForest にする（COMPACT_FORESTS_ENABLED=true の場合のみ）
+
+        バージョンに compact_forest.py --save で保存したもの（元の森との比較に合格済み）があればそれを使い、
+        無ければ float32 で変換する（量子化は比較してから保存したものだけを使う）。
+        """
+        if not COMPACT_FORESTS_ENABLED or not is_forest(loaded.model):
+            return loaded
+        compact = None
+        if loaded.version != 'legacy':
+            compact = self.store.load_compact(bean_name, loaded.version)
+        if compact is None:
+            compact = CompactForest(loaded.model, 'float32')
+        return LoadedModel(compact, loaded.preprocessing_info, loaded.version)
+
+    def _with_online(self, bean_name, loaded):
+        """オンライン更新の補正があれば元のモデルに加える（補正が別のバージョン向けの場合は使わない）"""
+        if not ONLINE_UPDATES_ENABLED or loaded.version == 'legacy':
+            return loaded
+        model = loaded.model.base if isinstance(loaded.model, OnlineForest) else loaded.model
+        version = base_version(loaded.version)
+        correction = self.store.load_online(bean_name)
+        if correction is None or correction.base_version != version or correction.updates == 0:
+            return LoadedModel(model, loaded.preprocessing_info, version)
+        return LoadedModel(OnlineForest(model, correction), loaded.preprocessing_info, f"{version}+{correction.updates}")
+
+    def _load_shared(self):
+        artifact = global_model.load_global_model(self.store)
+        if artifact is not None:
+            artifact.setdefault('version', self.store.current_version(GLOBAL_MODEL_KEY) or 'legacy')
+        return artifact
+
+    def get(self, bean_name):
+        """豆のモデル（無ければNone）"""
+        return self.current.beans.get(bean_name)
+
+    def reload(self, bean_names):
+        """
+        指定した豆の CURRENT を読み込み直して ModelSet を差し替える
+
+        Returns:
+            list: 実際に差し替えた豆名
+        """
+        with self._lock:
+            current = self.current
+            beans = dict(current.beans)
+            shared = current.shared
+            changed = []
+            swapped = []
+
+            for bean_name in set(bean_names):
+                if bean_name == GLOBAL_MODEL_KEY:
+                    if not global_model.is_enabled():
+                        continue
+                    version = self.store.current_version(GLOBAL_MODEL_KEY)
+                    if shared is not None and shared.get('version') == version:
+                        continue
+                    shared = self._load_shared()
+                    changed.append(bean_name)
+                    swapped.append(bean_name)
+                    continue
+
+                version = self.store.current_version(bean_name)
+                loaded = beans.get(bean_name)
+                if version is None:
+                    continue
+                if loaded is not None and base_version(loaded.version) == version:
+                    # 元のモデルは同じで、オンライン更新の補正だけが変わった場合
+                    updated = self._with_online(bean_name, loaded)
+                    if updated.version != loaded.version:
+                        beans[bean_name] = updated
+                        changed.append(bean_name)
+                    continue
+                try:
+                    model, preprocessing_info, version = self.store.load(bean_name, version)
+                except FileNotFoundError:
+                    # 読み込む前に次のバージョンが公開されて削除された場合は、次の変更で読み込む
+                    continue
+                if not self._accepts(preprocessing_info.get('sample_count', 0)):
+                    continue
+                loaded = self._compact(bean_name, LoadedModel(model, preprocessing_info, version))
+                beans[bean_name] = self._with_online(bean_name, loaded)
+                changed.append(bean_name)
+                swapped.append(bean_name)
+
+            if not changed:
+                return changed
+
+            self.current = ModelSet(beans, shared)
+            self.reloads += 1
+
+        print(f"モデルを再読み込みしました: {', '.join(changed)}")
+        if not swapped:
+            # 補正だけの変更はバージョンが変わるので、予測結果のキャッシュは自然に使われなくなる
+            return changed
+        for listener in self.listeners:
+            try:
+                listener(swapped)
+            except Exception as e:
+                print(f"モデル更新の通知でエラー: {e}")
+        return changed
+
+    def poll(self):
+        """変更履歴に追記された分を読み、変更された豆だけを再読み込み"""
+        try:
+            stat = os.stat(self.store.changes_path)
+        except FileNotFoundError:
+            return []
+
+        if stat.st_ino != self._changes_inode or stat.st_size < self._changes_offset:
+            # 変更履歴が作り直された場合は最初から読む（全ての豆の現在のバージョンが書かれているので、変わった豆だけが読み込まれる）
+            self._changes_inode, self._changes_offset = stat.st_ino, 0
+        if stat.st_size == self._changes_offset:
+            return []
+
+        changes, self._changes_offset = self.store.read_changes(self._changes_offset)
+        return self.reload([change['bean_name'] for change in changes if 'bean_name' in change])
+
+    def start(self):
+        """変更履歴を監視するバックグラウンドスレッドを開始"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='model-registry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"モデルの再読み込みエラー: {e}")
+
+    def stats(self):
+        """読み込み済みモデルの情報"""
+        current = self.current
+        return {
+            "watching": self._thread is not None,
+            "interval_seconds": self.interval,
+            "reloads": self.reloads,
+            "loaded_at": datetime.fromtimestamp(current.loaded_at).isoformat(),
+            "versions": {name: loaded.version for name, loaded in current.beans.items()},
+            "shared_version": current.shared.get('version') if current.shared else None,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,396 @@
+"""
+バージョン付きのモデルストア
+学習したモデルは毎回新しいディレクトリ（バージョン）に書き込み、書き終わってから公開する。
+公開済みのファイルは書き換えないため、読み込み中のファイルが途中で変わることはない。
+
+ディレクトリ構成（豆ごとに独立しているので、別の豆の学習は同時に行える）:
+    model/store/<豆名>-<ハッシュ>/
+        NAME                    豆名
+        CURRENT                 現在のバージョン名（一時ファイルからの os.replace で差し替え）
+        versions.log            公開・削除の履歴（1行1件のJSON、追記のみ）
+        online.pkl              CURRENT に対するオンライン更新の補正（online_model.py）
+        .lock                   同じ豆の公開処理の排他用
+        versions/<バージョン>/
+            model.pkl
+            preprocessing_info.pkl
+            meta.json
+            （feature_importance.png など）
+            compact_model.pkl       model.pkl を変換した CompactForest（compact_forest.py --save で公開後に追加）
+            compact_report.json     compact_model.pkl の元のモデルとの比較結果
+
+古いバージョンは MODEL_STORE_RETENTION 件を残して削除する。
+公開するたびにストア全体の変更履歴（model/store/changes.log）にも1行追記し、
+各ワーカーはこのファイルの増えた分だけを読んで新しいバージョンを検出する（model_registry.py）。
+変更履歴が MODEL_STORE_CHANGES_MAX_BYTES を超えたら、全ての豆の現在のバージョンを1行ずつ書いた新しいファイルに置き換える
+（各ワーカーはファイルが置き換えられたことを検出して最初から読み、読み込み済みのバージョンと同じ豆は何もしない）。
+ストアに無い豆は従来の model/bean_models_info.pkl と各pickleファイルから読み込む。
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from features import bean_name_to_safe
+
+MODEL_STORE_DIR = os.getenv('MODEL_STORE_DIR', 'model/store')
+
+# 豆ごとに残すバージョン数（CURRENT は常に残す）
+MODEL_STORE_RETENTION = int(os.getenv('MODEL_STORE_RETENTION', '3'))
+
+# 変更履歴（changes.log）をこのバイト数を超えたら作り直す
+MODEL_STORE_CHANGES_MAX_BYTES = int(os.getenv('MODEL_STORE_CHANGES_MAX_BYTES', str(1024 * 1024)))
+
+# 書き込み途中で残った一時ディレクトリを削除するまでの秒数
+STALE_STAGING_SECONDS = 3600
+
+# 共有モデルを保存するキー
+GLOBAL_MODEL_KEY = '__global__'
+
+LEGACY_MODELS_INFO_FILE = 'model/bean_models_info.pkl'
+
+MODEL_FILE = 'model.pkl'
+PREPROCESSING_FILE = 'preprocessing_info.pkl'
+META_FILE = 'meta.json'
+CHANGES_FILE = 'changes.log'
+ONLINE_FILE = 'online.pkl'
+COMPACT_MODEL_FILE = 'compact_model.pkl'
+COMPACT_REPORT_FILE = 'compact_report.json'
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _replace_file(path, data):
+    """一時ファイルに書いてから置き換える"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+    _write_file(tmp_path, data)
+    os.replace(tmp_path, path)
+
+
+def _read_text(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ModelStore:
+    """豆ごとのモデルのバージョン管理"""
+
+    def __init__(self, root=MODEL_STORE_DIR, retention=MODEL_STORE_RETENTION,
+                 changes_max_bytes=MODEL_STORE_CHANGES_MAX_BYTES):
+        self.root = root
+        self.retention = retention
+        self.changes_max_bytes = changes_max_bytes
+
+    def bean_dir(self, bean_name):
+        """豆のディレクトリ（豆名を変換した名前が衝突しないようにハッシュを付ける）"""
+        digest = hashlib.sha1(bean_name.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.root, f"{bean_name_to_safe(bean_name)}-{digest}")
+
+    def version_dir(self, bean_name, version):
+        return os.path.join(self.bean_dir(bean_name), 'versions', version)
+
+    @contextmanager
+    def _bean_lock(self, bean_dir):
+        """同じ豆の公開処理だけを排他する（他の豆はブロックしない）"""
+        with open(os.path.join(bean_dir, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_log(self, directory, entry, name='versions.log'):
+        """履歴に1行追記（O_APPEND の1回の write なので途中の行が混ざらない）"""
+        line = (json.dumps(entry, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        fd = os.open(os.path.join(directory, name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _changes_lock(self, exclusive):
+        """変更履歴の追記（共有）と作り直し（排他）の排他"""
+        with open(os.path.join(self.root, '.changes.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_change(self, entry):
+        """変更履歴に1行追記し、上限を超えたら作り直す"""
+        with self._changes_lock(exclusive=False):
+            self._append_log(self.root, entry, name=CHANGES_FILE)
+        try:
+            size = os.path.getsize(self.changes_path)
+        except FileNotFoundError:
+            return
+        if size > self.changes_max_bytes:
+            self._rotate_changes()
+
+    def _rotate_changes(self):
+        """
+        変更履歴を全ての豆の現在のバージョン（1豆1行）だけのファイルに置き換える
+
+        追記を止めてから CURRENT を読むので、置き換える前の変更は全て新しいファイルの内容に含まれる。
+        """
+        with self._changes_lock(exclusive=True):
+            if os.path.getsize(self.changes_path) <= self.changes_max_bytes:
+                # 別のプロセスが先に作り直した場合
+                return
+            names = self.bean_names()
+            if self.current_version(GLOBAL_MODEL_KEY) is not None:
+                names.append(GLOBAL_MODEL_KEY)
+            lines = [
+                json.dumps({'bean_name': name, 'version': self.current_version(name), 'event': 'rotate'},
+                           ensure_ascii=False) + '\n'
+                for name in names
+            ]
+            _replace_file(self.changes_path, ''.join(lines).encode('utf-8'))
+        print(f"モデルストアの変更履歴を作り直しました: {len(names)}件の豆")
+
+    @property
+    def changes_path(self):
+        return os.path.join(self.root, CHANGES_FILE)
+
+    def read_changes(self, offset=0):
+        """
+        変更履歴の offset バイト目以降を読む（書き込み途中の最後の行は次回に回す）
+
+        Returns:
+            tuple: (変更のリスト [{'bean_name', 'version'}], 次に読む位置)
+        """
+        try:
+            with open(self.changes_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        end = data.rfind(b'\n') + 1
+        changes = []
+        for line in data[:end].splitlines():
+            try:
+                changes.append(json.loads(line))
+            except ValueError:
+                continue
+        return changes, offset + end
+
+    def publish(self, bean_name, model, preprocessing_info, extra_files=None):
+        """
+        新しいバージョンを書き込んで公開
+
+        一時ディレクトリに全てのファイルを書いてから rename し、最後に CURRENT を差し替える。
+        同じ豆を同時に学習した場合は後から公開したバージョンが CURRENT になる。
+
+        Args:
+            extra_files: ファイル名 -> バイト列（特徴量重要度の画像など）
+
+        Returns:
+            str: 公開したバージョン名
+        """
+        bean_dir = self.bean_dir(bean_name)
+        versions_dir = os.path.join(bean_dir, 'versions')
+        os.makedirs(versions_dir, exist_ok=True)
+        if _read_text(os.path.join(bean_dir, 'NAME')) is None:
+            _replace_file(os.path.join(bean_dir, 'NAME'), bean_name.encode('utf-8'))
+
+        version = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+        meta = {
+            'bean_name': bean_name,
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'sample_count': preprocessing_info.get('sample_count'),
+            'data_version': preprocessing_info.get('data_version'),
+            'model_type': type(model).__name__
+        }
+
+        staging_dir = os.path.join(versions_dir, f".tmp-{version}")
+        os.makedirs(staging_dir)
+        try:
+            _write_file(os.path.join(staging_dir, MODEL_FILE), pickle.dumps(model))
+            _write_file(os.path.join(staging_dir, PREPROCESSING_FILE), pickle.dumps(preprocessing_info))
+            for name, data in (extra_files or {}).items():
+                _write_file(os.path.join(staging_dir, name), data)
+            _write_file(
+                os.path.join(staging_dir, META_FILE),
+                json.dumps(meta, ensure_ascii=False, default=str).encode('utf-8')
+            )
+            os.rename(staging_dir, os.path.join(versions_dir, version))
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        with self._bean_lock(bean_dir):
+            self._append_log(bean_dir, dict(meta, event='publish'))
+            _replace_file(os.path.join(bean_dir, 'CURRENT'), version.encode('utf-8'))
+            self._collect_garbage(bean_dir, version)
+        self._append_change({'bean_name': bean_name, 'version': version})
+
+        print(f"モデルを公開しました: {bean_name} ({version})")
+        return version
+
+    def _collect_garbage(self, bean_dir, current):
+        """保持数を超えた古いバージョンと、残ってしまった一時ディレクトリを削除"""
+        versions_dir = os.path.join(bean_dir, 'versions')
+        names = sorted(os.listdir(versions_dir))
+        now = time.time()
+
+        for name in names:
+            path = os.path.join(versions_dir, name)
+            if name.startswith('.tmp-') and now - os.path.getmtime(path) > STALE_STAGING_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+
+        versions = [name for name in names if not name.startswith('.')]
+        keep = set(versions[-self.retention:]) if self.retention > 0 else set()
+        keep.add(current)
+        for name in versions:
+            if name not in keep:
+                shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+                self._append_log(bean_dir, {'event': 'delete', 'version': name, 'deleted_at': datetime.now().isoformat()})
+
+    def update_online(self, bean_name, update):
+        """
+        オンライン更新の補正を読み込み・更新・保存（同じ豆の更新は複数のワーカー間でも排他）
+
+        Args:
+            update: 現在の補正（無ければNone）と CURRENT のバージョンを受け取り、新しい補正を返す関数
+
+        Returns:
+            新しい補正
+        """
+        bean_dir = self.bean_dir(bean_name)
+        path = os.path.join(bean_dir, ONLINE_FILE)
+        with self._bean_lock(bean_dir):
+            version = self.current_version(bean_name)
+            state = self.load_online(bean_name)
+            state = update(state, version)
+            _replace_file(path, pickle.dumps(state))
+        self._append_change({'bean_name': bean_name, 'version': state.base_version, 'online_updates': state.updates})
+        return state
+
+    def load_online(self, bean_name):
+        """オンライン更新の補正（無ければNone）"""
+        try:
+            with open(os.path.join(self.bean_dir(bean_name), ONLINE_FILE), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def current_version(self, bean_name):
+        """現在のバージョン名（ストアに無い場合はNone）"""
+        return _read_text(os.path.join(self.bean_dir(bean_name), 'CURRENT'))
+
+    def versions(self, bean_name):
+        """公開済みで削除されていないバージョンの履歴（古い順）"""
+        path = os.path.join(self.bean_dir(bean_name), 'versions.log')
+        published = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('event') == 'publish':
+                        published[entry['version']] = entry
+                    elif entry.get('event') == 'delete':
+                        published.pop(entry['version'], None)
+        except FileNotFoundError:
+            pass
+        return list(published.values())
+
+    def bean_names(self):
+        """ストアにある豆名の一覧（共有モデルのキーは除く）"""
+        names = []
+        try:
+            entries = os.listdir(self.root)
+        except FileNotFoundError:
+            return names
+        for entry in sorted(entries):
+            if not os.path.isdir(os.path.join(self.root, entry)):
+                continue
+            name = _read_text(os.path.join(self.root, entry, 'NAME'))
+            if name is not None and name != GLOBAL_MODEL_KEY:
+                names.append(name)
+        return names
+
+    def load(self, bean_name, version=None):
+        """
+        モデルを読み込み（version を省略した場合は CURRENT）
+
+        Returns:
+            tuple: (モデル, 前処理情報, バージョン名)。ストアに無い場合はNone
+        """
+        version = version or self.current_version(bean_name)
+        if version is None:
+            return None
+        path = self.version_dir(bean_name, version)
+        with open(os.path.join(path, MODEL_FILE), 'rb') as f:
+            model = pickle.load(f)
+        with open(os.path.join(path, PREPROCESSING_FILE), 'rb') as f:
+            preprocessing_info = pickle.load(f)
+        return model, preprocessing_info, version
+
+    def save_compact(self, bean_name, version, compact_model, report):
+        """公開済みのバージョンに CompactForest と比較結果を追加（model.pkl は書き換えない）"""
+        path = self.version_dir(bean_name, version)
+        _replace_file(
+            os.path.join(path, COMPACT_REPORT_FILE),
+            json.dumps(report, ensure_ascii=False, indent=2).encode('utf-8')
+        )
+        _replace_file(os.path.join(path, COMPACT_MODEL_FILE), pickle.dumps(compact_model))
+
+    def load_compact(self, bean_name, version):
+        """バージョンに追加された CompactForest（無ければNone）"""
+        try:
+            with open(os.path.join(self.version_dir(bean_name, version), COMPACT_MODEL_FILE), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load_with_legacy(self, bean_name):
+        """ストアから読み込み、無ければ従来の pickle ファイルから読み込む（どちらも無ければNone）"""
+        loaded = self.load(bean_name)
+        if loaded is not None:
+            return loaded
+        return load_legacy_model(bean_name)
+
+
+def load_legacy_models_info(path=LEGACY_MODELS_INFO_FILE):
+    """従来のモデル一覧（豆名 -> ファイル情報）。無ければ空"""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_legacy_model(bean_name):
+    """従来の model/random_forest_<豆名>.pkl と前処理情報を読み込み（無ければNone）"""
+    bean_name_safe = bean_name_to_safe(bean_name)
+    model_file = f'model/random_forest_{bean_name_safe}.pkl'
+    preprocessing_file = f'model/preprocessing_info_{bean_name_safe}.pkl'
+    try:
+        with open(model_file, 'rb') as f:
+            model = pickle.load(f)
+        with open(preprocessing_file, 'rb') as f:
+            preprocessing_info = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    return model, preprocessing_info, 'legacy'
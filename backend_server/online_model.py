@@ -0,0 +1,176 @@
+"""
+新しいレシピによる豆ごとのモデルのオンライン更新
+
+RandomForest を毎回学習し直す代わりに、モデルストアの CURRENT のモデル（元の森）はそのままにして、
+新しいレシピでの予測誤差（残差）を線形モデル（PassiveAggressiveRegressor の partial_fit）で少しずつ学習する。
+1回の更新の大きさはその入力での残差を超えないため、入力が学習データと大きく違っても発散しない。
+予測は「元の森の予測 + 残差の補正」になる。
+
+- 補正はモデルストアの豆のディレクトリ（online.pkl）に保存して変更履歴に追記するため、
+  他のワーカーも MODEL_RELOAD_INTERVAL_SECONDS 以内に反映する（model_registry.py）
+- 補正は CURRENT のバージョンごとに作り直す（学習し直したモデルには更新分のレシピも含まれる）
+- 学習するのは保存済みのレシピ（recipe.id）だけで、同じレシピを2回学習しない
+  （/online-update とレシピの変更確認（change_poller.py）の両方から同じレシピが来ても1回だけ。
+  元のモデルの学習データに含まれているレシピも学習しない）
+- ONLINE_REFIT_AFTER_UPDATES 回の更新、または最初の更新から ONLINE_REFIT_INTERVAL_SECONDS 秒経過したら
+  学習し直す（線形の補正だけで長期間運用して誤差がたまらないようにする）
+"""
+
+import copy
+import os
+import time
+
+import numpy as np
+
+from features import TARGET_TOLERANCES, as_model_input, encode_inputs
+
+# オンライン更新を受け付けるかどうか（true / false）
+ONLINE_UPDATES_ENABLED = os.getenv('ONLINE_UPDATES_ENABLED', 'true').lower() == 'true'
+
+# この回数の更新で学習し直す
+ONLINE_REFIT_AFTER_UPDATES = int(os.getenv('ONLINE_REFIT_AFTER_UPDATES', '50'))
+
+# 最初の更新からこの秒数が経過したら学習し直す
+ONLINE_REFIT_INTERVAL_SECONDS = float(os.getenv('ONLINE_REFIT_INTERVAL_SECONDS', '86400'))
+
+# 1回の更新の大きさの上限（PassiveAggressiveRegressor の C。小さいほど1件のレシピの影響が小さい）
+ONLINE_MAX_STEP = float(os.getenv('ONLINE_MAX_STEP', '0.1'))
+
+
+class OnlineCorrection:
+    """
+    あるバージョンのモデルに対する残差の補正
+
+    特徴量は元のモデルの学習データの平均・標準偏差で標準化し、
+    残差は各ターゲットの許容誤差（TARGET_TOLERANCES）で割って同じくらいの大きさにしてから学習する。
+    """
+
+    def __init__(self, base_version, target_names, feature_mean, feature_scale):
+        from sklearn.linear_model import PassiveAggressiveRegressor
+        from sklearn.multioutput import MultiOutputRegressor
+
+        self.base_version = base_version
+        self.target_names = list(target_names)
+        self.feature_mean = np.asarray(feature_mean, dtype=np.float64)
+        self.feature_scale = np.where(np.asarray(feature_scale, dtype=np.float64) > 0, feature_scale, 1.0)
+        self.target_scale = np.array([TARGET_TOLERANCES[name] for name in self.target_names])
+        self.regressor = MultiOutputRegressor(PassiveAggressiveRegressor(
+            C=ONLINE_MAX_STEP,
+            epsilon=0.0,
+            random_state=42
+        ))
+        self.updates = 0
+        self.recipe_ids = set()         # 学習済みの recipe.id
+        self.first_update_at = None
+        self.updated_at = None
+
+    def _scale(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.feature_mean) / self.feature_scale
+
+    def learn(self, X, residuals, recipe_ids=()):
+        """残差（実測値 - 元のモデルの予測）を学習（self は変更せず、更新したコピーを返す）"""
+        updated = copy.deepcopy(self)
+        updated.regressor.partial_fit(updated._scale(X), np.atleast_2d(residuals) / updated.target_scale)
+        now = time.time()
+        updated.updates += len(X)
+        updated.recipe_ids = set(getattr(self, 'recipe_ids', ())) | set(recipe_ids)
+        updated.first_update_at = updated.first_update_at or now
+        updated.updated_at = now
+        return updated
+
+    def predict(self, X):
+        """残差の補正 (行数, ターゲット数)"""
+        if self.updates == 0:
+            return np.zeros((len(X), len(self.target_names)))
+        return self.regressor.predict(self._scale(X)) * self.target_scale
+
+    def refit_due(self):
+        """学習し直す時期かどうか"""
+        if self.updates >= ONLINE_REFIT_AFTER_UPDATES:
+            return True
+        return self.first_update_at is not None and time.time() - self.first_update_at >= ONLINE_REFIT_INTERVAL_SECONDS
+
+
+class OnlineForest:
+    """元の森の予測に残差の補正を加えるモデル（予測区間は元の森の区間を補正分ずらす: forest_utils.py）"""
+
+    def __init__(self, base, correction):
+        self.base = base
+        self.correction = correction
+        if hasattr(base, 'feature_names_in_'):
+            self.feature_names_in_ = base.feature_names_in_
+
+    def predict(self, X):
+        return self.base.predict(X) + self.correction.predict(np.asarray(X))
+
+    @property
+    def feature_importances_(self):
+        return self.base.feature_importances_
+
+
+def feature_statistics(X):
+    """特徴量の平均と標準偏差（OnlineCorrection の標準化用に前処理情報に保存する）"""
+    X = np.asarray(X, dtype=np.float64)
+    return X.mean(axis=0).tolist(), X.std(axis=0).tolist()
+
+
+def apply_online_update(store, bean_name, loaded, recipe_ids, records, targets, training_data=None):
+    """
+    保存済みのレシピで豆の補正を更新してモデルストアに保存
+
+    補正が学習済みのレシピと、元のモデルの学習データに含まれているレシピ（data_version の最大ID以下）は学習しない。
+
+    Args:
+        loaded: 現在のモデル（model_registry.LoadedModel）
+        recipe_ids: 各レシピの recipe.id
+        records: 入力のリスト（PredictionInput と同じ項目）
+        targets: 実測値 (行数, ターゲット数)
+        training_data: 前処理情報に特徴量の統計が無い古いモデル用に、学習データを返す関数
+
+    Returns:
+        tuple: (更新後の補正（学習するレシピが無かった場合は現在の補正、無ければNone）, 学習したレシピ数)
+    """
+    model = loaded.model.base if isinstance(loaded.model, OnlineForest) else loaded.model
+    preprocessing_info = loaded.preprocessing_info
+    feature_names = preprocessing_info['feature_names']
+    recipe_ids = [int(recipe_id) for recipe_id in recipe_ids]
+    trained_max_id = (preprocessing_info.get('data_version') or (None, None))[1]
+
+    def unlearned(state):
+        """まだ学習していないレシピの位置"""
+        learned = getattr(state, 'recipe_ids', set()) if state is not None and state.base_version == version else set()
+        return [
+            i for i, recipe_id in enumerate(recipe_ids)
+            if recipe_id not in learned and (trained_max_id is None or recipe_id > trained_max_id)
+        ]
+
+    version = loaded.version.split('+')[0]
+    current = store.load_online(bean_name)
+    if not unlearned(current):
+        return current, 0
+
+    X = encode_inputs(records, feature_names)
+    residuals = np.asarray(targets, dtype=np.float64) - model.predict(as_model_input(model, X, feature_names))
+    learned_count = 0
+
+    def update(state, current_version):
+        nonlocal learned_count
+        if current_version is None:
+            raise ValueError(f"豆 '{bean_name}' のモデルがモデルストアにありません。先に学習してください")
+        if current_version != version:
+            # 読み込み済みのモデルより新しいバージョンが公開されていれば、次の読み込みで反映されるまで待つ
+            raise ValueError(f"豆 '{bean_name}' のモデルが更新中です。しばらくしてから再度実行してください")
+        # 別のワーカー・変更確認が同時に同じレシピを学習した場合に備えて、排他の中でもう一度確認する
+        rows = unlearned(state)
+        if state is None or state.base_version != current_version:
+            if 'feature_mean' in preprocessing_info:
+                mean, scale = preprocessing_info['feature_mean'], preprocessing_info['feature_scale']
+            else:
+                mean, scale = feature_statistics(training_data(bean_name).X)
+            state = OnlineCorrection(current_version, preprocessing_info['target_names'], mean, scale)
+        if not rows:
+            return state
+        learned_count = len(rows)
+        return state.learn(X[rows], residuals[rows], [recipe_ids[i] for i in rows])
+
+    return store.update_online(bean_name, update), learned_count
@@ -0,0 +1,127 @@
+"""
+予測結果のキャッシュ
+同じモデルのバージョン・同じ入力の予測は結果が同じなので、特徴量のエンコードとモデルの呼び出しを省略する
+
+キーは (エンドポイント, 豆名, モデルのバージョン, 正規化した入力)。
+気温・湿度は PREDICTION_CACHE_TEMPERATURE_STEP / PREDICTION_CACHE_HUMIDITY_STEP 刻みに丸めてから
+キーにもモデルの入力にも使う（0の場合は丸めない）。
+モデルのバージョンが変わるとキーが変わるため古い結果は使われず、invalidate() で削除もできる。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 最大件数（超えた場合は最も古く使われたものから削除）
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+
+# 有効期限（秒）
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+
+# 気温・湿度の丸めの刻み（0の場合は丸めない）
+PREDICTION_CACHE_TEMPERATURE_STEP = float(os.getenv('PREDICTION_CACHE_TEMPERATURE_STEP', '0'))
+PREDICTION_CACHE_HUMIDITY_STEP = float(os.getenv('PREDICTION_CACHE_HUMIDITY_STEP', '0'))
+
+
+def quantize(value, step):
+    """value を step 刻みに丸める（Noneはそのまま）"""
+    if value is None:
+        return None
+    if step > 0:
+        value = round(value / step) * step
+    # 浮動小数点の誤差で別のキーにならないようにする
+    return round(float(value), 6)
+
+
+class PredictionCache:
+    """LRU + 有効期限付きの予測結果のキャッシュ"""
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL,
+                 temperature_step=PREDICTION_CACHE_TEMPERATURE_STEP, humidity_step=PREDICTION_CACHE_HUMIDITY_STEP):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.temperature_step = temperature_step
+        self.humidity_step = humidity_step
+        self._entries = OrderedDict()       # キー -> (保存した時刻, 結果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def normalize(self, record):
+        """入力を正規化（予測にもこの値を使う）"""
+        return dict(
+            record,
+            temperature=quantize(record.get('temperature'), self.temperature_step),
+            humidity=quantize(record.get('humidity'), self.humidity_step),
+            days_passed=quantize(record.get('days_passed'), 0)
+        )
+
+    @staticmethod
+    def make_key(endpoint, model_version, record):
+        return (
+            endpoint,
+            record.get('bean_name'),
+            model_version,
+            record.get('bean_origin'),
+            record.get('date'),
+            record.get('weather'),
+            record.get('temperature'),
+            record.get('humidity'),
+            record.get('days_passed')
+        )
+
+    def get(self, key):
+        """キャッシュされた結果（無い・期限切れの場合はNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if time.time() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.time(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, bean_names=None):
+        """指定した豆（省略時は全て）の結果を削除"""
+        with self._lock:
+            if bean_names is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                bean_names = set(bean_names)
+                keys = [key for key in self._entries if key[1] in bean_names]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            self.invalidations += removed
+            return removed
+
+    def stats(self):
+        """キャッシュの統計情報"""
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "temperature_step": self.temperature_step,
+            "humidity_step": self.humidity_step,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+依存サービス（MySQL・Spring Boot）の準備完了の確認
+
+insert_data.py が必要とするのは「Spring Boot の DataInitializer が beans テーブルにデータを入れ終わったこと」なので、
+ポートが開いたかではなく、beans テーブルが存在して行があるかを MySQL で直接確認する。
+Spring Boot の応答も同時に確認するが、待つ条件は beans テーブルの方だけ（条件を満たした時点ですぐに終了する）。
+
+各確認は別スレッドで並行に行い、失敗したら READINESS_INITIAL_INTERVAL 秒から2倍ずつ
+（最大 READINESS_MAX_INTERVAL 秒）間隔を空けて再確認する。全体の待ち時間の上限は READINESS_DEADLINE_SECONDS 秒。
+
+使い方:
+    python readiness.py     # 準備完了なら終了コード 0、期限切れなら 1
+"""
+
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import mysql.connector
+from mysql.connector import errorcode
+
+# 全体の待ち時間の上限（秒）
+READINESS_DEADLINE_SECONDS = float(os.getenv('READINESS_DEADLINE_SECONDS', '300'))
+
+# 再確認の間隔（最初の間隔から2倍ずつ、最大の間隔まで）
+READINESS_INITIAL_INTERVAL = float(os.getenv('READINESS_INITIAL_INTERVAL', '0.1'))
+READINESS_MAX_INTERVAL = float(os.getenv('READINESS_MAX_INTERVAL', '5'))
+
+SPRING_BOOT_URL = os.getenv('SPRING_BOOT_URL', 'http://springboot:8080/')
+
+# 1回の確認のタイムアウト（秒）
+CHECK_TIMEOUT = 3
+
+
+def check_mysql_table(mysql_config, table='beans'):
+    """
+    テーブルが存在して行があるかを確認
+
+    Returns:
+        tuple: (準備完了かどうか, 状態の説明)
+    """
+    try:
+        connection = mysql.connector.connect(connection_timeout=CHECK_TIMEOUT, **mysql_config)
+    except mysql.connector.Error as e:
+        return False, f"MySQLに接続できません: {e.msg}"
+    cursor = connection.cursor()
+    try:
+        # LIMIT 1 で行があるかだけを確認（件数は数えない）
+        cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+        if cursor.fetchone() is None:
+            return False, f"{table} テーブルにデータがありません"
+        return True, f"{table} テーブルにデータがあります"
+    except mysql.connector.Error as e:
+        if e.errno == errorcode.ER_NO_SUCH_TABLE:
+            return False, f"{table} テーブルがまだ作成されていません"
+        return False, f"{table} テーブルを確認できません: {e.msg}"
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def check_http(url):
+    """URL が 200 を返すかを確認"""
+    try:
+        with urllib.request.urlopen(url, timeout=CHECK_TIMEOUT) as response:
+            return response.status == 200, f"HTTP {response.status}"
+    except Exception as e:
+        return False, f"接続できません: {e}"
+
+
+class ReadinessCheck:
+    """1つの確認の状態（失敗したら間隔を広げながら再確認する）"""
+
+    def __init__(self, name, check, required=True):
+        self.name = name
+        self.check = check
+        self.required = required
+        self.ready = False
+        self.attempts = 0
+        self.detail = None
+        self.ready_seconds = None
+        self.done = threading.Event()
+
+    def run(self, started, deadline, stop, initial_interval, max_interval):
+        interval = initial_interval
+        while not stop.is_set():
+            self.attempts += 1
+            self.ready, detail = self.check()
+            if detail != self.detail:
+                print(f"{'✅' if self.ready else '⏳'} {self.name}: {detail} ({time.monotonic() - started:.1f}秒)")
+            self.detail = detail
+            if self.ready:
+                self.ready_seconds = time.monotonic() - started
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            stop.wait(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+        self.done.set()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "required": self.required,
+            "attempts": self.attempts,
+            "ready_seconds": self.ready_seconds,
+            "detail": self.detail
+        }
+
+
+def wait_until_ready(checks, deadline_seconds=READINESS_DEADLINE_SECONDS,
+                     initial_interval=READINESS_INITIAL_INTERVAL, max_interval=READINESS_MAX_INTERVAL):
+    """
+    全ての確認を並行に行い、required の確認が全て成功するか期限を過ぎるまで待つ
+
+    Args:
+        checks: ReadinessCheck のリスト
+
+    Returns:
+        tuple: (required の確認が全て成功したかどうか, 確認名 -> 状態)
+    """
+    started = time.monotonic()
+    deadline = started + deadline_seconds
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=check.run, args=(started, deadline, stop, initial_interval, max_interval),
+            name=f'readiness-{check.name}', daemon=True
+        )
+        for check in checks
+    ]
+    for thread in threads:
+        thread.start()
+
+    for check in checks:
+        if check.required:
+            check.done.wait(max(0.0, deadline - time.monotonic()) + CHECK_TIMEOUT)
+    # 待つ条件を満たしたら、残りの確認（required でないもの）は打ち切る
+    stop.set()
+
+    ready = all(check.ready for check in checks if check.required)
+    return ready, {check.name: check.stats() for check in checks}
+
+
+def wait_for_initial_data(mysql_config, spring_boot_url=SPRING_BOOT_URL, deadline_seconds=READINESS_DEADLINE_SECONDS):
+    """
+    DataInitializer が beans テーブルにデータを入れ終わるまで待つ（Spring Boot の応答も並行して確認）
+
+    Returns:
+        bool: 期限内に beans テーブルにデータが入ったかどうか
+    """
+    print("⏳ MySQL（beans テーブル）と Spring Boot の準備完了を待機中...")
+    checks = [
+        ReadinessCheck('mysql', lambda: check_mysql_table(mysql_config, 'beans')),
+        ReadinessCheck('springboot', lambda: check_http(spring_boot_url), required=False),
+    ]
+    started = time.monotonic()
+    ready, status = wait_until_ready(checks, deadline_seconds)
+    elapsed = time.monotonic() - started
+    if ready:
+        print(f"✅ 準備完了しました ({elapsed:.1f}秒)")
+    else:
+        details = ', '.join(f"{name}={s['detail']}" for name, s in status.items())
+        print(f"❌ {deadline_seconds:.0f}秒以内に準備完了しませんでした: {details}")
+    return ready
+
+
+if __name__ == "__main__":
+    from db_config import get_mysql_config
+    sys.exit(0 if wait_for_initial_data(get_mysql_config()) else 1)
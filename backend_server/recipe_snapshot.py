@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+レシピの列指向スナップショット（Arrow / Parquet）
+
+recipe JOIN beans を列指向のファイルに書き出し、一括再学習やバックテストを
+本番の MySQL に接続せずに行えるようにする（retrain_all.py --snapshot）。
+
+ディレクトリ構成:
+    data/recipe_snapshot/
+        manifest.json                       形式・分割方法・列・書き出し済みの最大 recipe.id・豆ごとの (件数, 最大ID)・各分割のファイル
+        bean=<豆名>-<ハッシュ>/part-<最初のID>-<最後のID>.arrow    （RECIPE_SNAPSHOT_PARTITION=bean）
+        month=2025-01/part-<最初のID>-<最後のID>.arrow              （RECIPE_SNAPSHOT_PARTITION=month）
+
+- 2回目以降は manifest.json の最大 recipe.id より後の行だけを新しいファイルとして追記する
+  （recipe に更新日時の列は無いため、編集・削除を反映するには --full で作り直す）
+- 1つの分割のファイルが RECIPE_SNAPSHOT_MAX_FILES 個を超えたら1つにまとめる
+- 読み込みは manifest.json に載っているファイルだけを対象にするため、書き出しの途中で中断しても壊れない
+- arrow 形式（圧縮なしの Arrow IPC）はメモリマップで読み込み、列のデータをコピーせずに使う。
+  parquet 形式は容量が小さい代わりに読み込み時に展開が必要
+
+使い方:
+    python recipe_snapshot.py                       # 前回の続きから書き出し
+    python recipe_snapshot.py --full                # 全て書き出し直す
+    python recipe_snapshot.py --partition-by month  # 月ごとに分割（分割方法を変えた場合は全て書き出し直す）
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import mysql.connector
+
+from feature_cache import build_training_data
+from feature_store import date_features, execute_recipe_query
+from features import DATE_FEATURE_COLUMNS, MIN_TRAINING_SAMPLES, RECIPE_COLUMNS, bean_name_to_safe
+
+RECIPE_SNAPSHOT_DIR = os.getenv('RECIPE_SNAPSHOT_DIR', 'data/recipe_snapshot')
+
+# 分割方法（bean: 豆ごと / month: 月ごと）
+RECIPE_SNAPSHOT_PARTITION = os.getenv('RECIPE_SNAPSHOT_PARTITION', 'bean')
+
+# ファイル形式（arrow / parquet）
+RECIPE_SNAPSHOT_FORMAT = os.getenv('RECIPE_SNAPSHOT_FORMAT', 'arrow')
+
+# 1つの分割のファイル数がこれを超えたらまとめる
+RECIPE_SNAPSHOT_MAX_FILES = int(os.getenv('RECIPE_SNAPSHOT_MAX_FILES', '16'))
+
+MANIFEST_FILE = 'manifest.json'
+
+# 前回書き出した位置より後の行（主キーの範囲だけを読む。日付の特徴量は recipe_features から読む）
+EXPORT_QUERY = """
+SELECT r.id, b.name, b.from_location, r.gram, r.mesh, r.extraction_time, r.date, r.weather,
+       r.temperature, r.humidity, r.days_passed, {features}
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+{join}
+WHERE r.id > %s
+ORDER BY r.id
+"""
+
+# スナップショットの列（RECIPE_COLUMNS に recipe.id・豆名・産地と日付の特徴量を加えたもの）
+SNAPSHOT_COLUMNS = ['id', 'bean_name', 'bean_origin'] + RECIPE_COLUMNS + DATE_FEATURE_COLUMNS
+
+FILE_EXTENSIONS = {'arrow': 'arrow', 'parquet': 'parquet'}
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('bean_name', pa.string()),
+        ('bean_origin', pa.string()),
+        ('gram', pa.float64()),
+        ('mesh', pa.float64()),
+        ('extraction_time', pa.float64()),
+        ('date', pa.date32()),
+        ('weather', pa.string()),
+        ('temperature', pa.float64()),
+        ('humidity', pa.float64()),
+        ('days_passed', pa.float64()),
+        ('year', pa.int16()),
+        ('month', pa.int8()),
+        ('day', pa.int8()),
+        ('day_of_week', pa.int8()),
+    ])
+
+
+def partition_key(partition_by, bean_name, date):
+    """行の分割先（ディレクトリ名）"""
+    if partition_by == 'bean':
+        digest = hashlib.sha1(bean_name.encode('utf-8')).hexdigest()[:8]
+        return f"bean={bean_name_to_safe(bean_name)}-{digest}"
+    return f"month={str(date)[:7]}"
+
+
+def _write_table(table, path, file_format):
+    """一時ファイルに書いてから置き換える"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+    if file_format == 'parquet':
+        pq.write_table(table, tmp_path)
+    else:
+        # メモリマップでそのまま使えるように圧縮しない
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _read_table(path, file_format):
+    """メモリマップで読み込み（arrow 形式は列のデータをコピーしない）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == 'parquet':
+        return pq.read_table(path, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def load_manifest(root=RECIPE_SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_manifest(root, manifest):
+    manifest['updated_at'] = datetime.now().isoformat()
+    path = os.path.join(root, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _fetch_new_rows(mysql_config, watermark, batch_size=10000):
+    """前回の位置より後の行を列ごとのリストで取得"""
+    columns = {name: [] for name in SNAPSHOT_COLUMNS}
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    try:
+        execute_recipe_query(cursor, EXPORT_QUERY, (watermark,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if row[-1] is None:
+                    # recipe_features にまだ保存されていない行・日付と一致しない行（結合時に NULL）はここで計算
+                    row = row[:-len(DATE_FEATURE_COLUMNS)] + date_features(row[SNAPSHOT_COLUMNS.index('date')])
+                for name, value in zip(SNAPSHOT_COLUMNS, row):
+                    columns[name].append(value)
+    finally:
+        cursor.close()
+        connection.close()
+    return columns
+
+
+def _compact(root, manifest, key):
+    """分割のファイルを1つにまとめる（古いファイルは manifest.json を更新してから削除）"""
+    import pyarrow as pa
+
+    files = manifest['partitions'][key]
+    file_format = manifest['format']
+    table = pa.concat_tables([_read_table(os.path.join(root, name), file_format) for name in files])
+    first_id, last_id = table['id'][0].as_py(), table['id'][-1].as_py()
+    name = f"{key}/part-{first_id:010d}-{last_id:010d}.{FILE_EXTENSIONS[file_format]}"
+    _write_table(table, os.path.join(root, name), file_format)
+    manifest['partitions'][key] = [name]
+    _save_manifest(root, manifest)
+    for old in files:
+        if old != name:
+            os.remove(os.path.join(root, old))
+
+
+def export_snapshot(mysql_config, root=RECIPE_SNAPSHOT_DIR, partition_by=RECIPE_SNAPSHOT_PARTITION,
+                    file_format=RECIPE_SNAPSHOT_FORMAT, full=False):
+    """
+    前回書き出した位置より後の行をスナップショットに追記
+
+    Returns:
+        dict: 書き出した行数・ファイル数・書き出し済みの最大 recipe.id・所要時間（秒）
+    """
+    import pyarrow as pa
+
+    if partition_by not in ('bean', 'month'):
+        raise ValueError(f"分割方法は bean か month です: {partition_by}")
+    if file_format not in FILE_EXTENSIONS:
+        raise ValueError(f"ファイル形式は arrow か parquet です: {file_format}")
+
+    started = time.perf_counter()
+    manifest = load_manifest(root)
+    if manifest is not None and (manifest['partition_by'] != partition_by or manifest['format'] != file_format):
+        print(f"分割方法・形式が変わったため全て書き出し直します "
+              f"({manifest['partition_by']}/{manifest['format']} -> {partition_by}/{file_format})")
+        full = True
+    if manifest is not None and manifest.get('columns') != SNAPSHOT_COLUMNS:
+        print("スナップショットの列が変わったため全て書き出し直します")
+        full = True
+    if full or manifest is None:
+        if manifest is not None:
+            shutil.rmtree(root)
+        manifest = {
+            'format': file_format,
+            'partition_by': partition_by,
+            'columns': SNAPSHOT_COLUMNS,
+            'watermark': 0,
+            'beans': {},
+            'partitions': {}
+        }
+    os.makedirs(root, exist_ok=True)
+
+    columns = _fetch_new_rows(mysql_config, manifest['watermark'])
+    row_count = len(columns['id'])
+    if row_count == 0:
+        return {'rows': 0, 'files': 0, 'watermark': manifest['watermark'], 'seconds': time.perf_counter() - started}
+
+    schema = _schema()
+    table = pa.table({name: pa.array(columns[name], type=schema.field(name).type) for name in SNAPSHOT_COLUMNS},
+                     schema=schema)
+
+    rows_by_partition = defaultdict(list)
+    for i, (bean_name, date) in enumerate(zip(columns['bean_name'], columns['date'])):
+        rows_by_partition[partition_key(partition_by, bean_name, date)].append(i)
+
+    for key, indices in rows_by_partition.items():
+        part = table.take(indices)
+        first_id, last_id = columns['id'][indices[0]], columns['id'][indices[-1]]
+        name = f"{key}/part-{first_id:010d}-{last_id:010d}.{FILE_EXTENSIONS[file_format]}"
+        _write_table(part, os.path.join(root, name), file_format)
+        manifest['partitions'].setdefault(key, []).append(name)
+
+    for bean_name, record_id in zip(columns['bean_name'], columns['id']):
+        count, max_id = manifest['beans'].get(bean_name, (0, None))
+        manifest['beans'][bean_name] = [count + 1, record_id if max_id is None else max(max_id, record_id)]
+    manifest['watermark'] = columns['id'][-1]
+    _save_manifest(root, manifest)
+
+    for key in rows_by_partition:
+        if len(manifest['partitions'][key]) > RECIPE_SNAPSHOT_MAX_FILES:
+            _compact(root, manifest, key)
+
+    return {
+        'rows': row_count,
+        'files': len(rows_by_partition),
+        'watermark': manifest['watermark'],
+        'seconds': time.perf_counter() - started
+    }
+
+
+class RecipeSnapshot:
+    """スナップショットからの学習データの読み込み（MySQL に接続しない）"""
+
+    def __init__(self, root=RECIPE_SNAPSHOT_DIR):
+        self.root = root
+        self.manifest = load_manifest(root)
+        if self.manifest is None:
+            raise FileNotFoundError(f"スナップショットがありません（python recipe_snapshot.py で作成）: {root}")
+
+    @property
+    def watermark(self):
+        return self.manifest['watermark']
+
+    def bean_versions(self, min_samples=MIN_TRAINING_SAMPLES):
+        """
+        学習対象の豆の一覧（retrain_all.fetch_bean_versions と同じ形式）
+
+        Returns:
+            dict: 豆名 -> データのバージョン (件数, 最大ID)
+        """
+        return {
+            name: (count, max_id)
+            for name, (count, max_id) in sorted(self.manifest['beans'].items())
+            if count >= min_samples
+        }
+
+    def read_table(self, bean_name=None):
+        """
+        豆（None の場合は全て）の行を pyarrow.Table で読み込み
+
+        豆ごとに分割している場合は豆のファイルだけ、月ごとの場合は全てのファイルを読んで絞り込む。
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        partitions = self.manifest['partitions']
+        if bean_name is not None and self.manifest['partition_by'] == 'bean':
+            files = partitions.get(partition_key('bean', bean_name, None), [])
+        else:
+            files = [name for key in sorted(partitions) for name in partitions[key]]
+
+        tables = [_read_table(os.path.join(self.root, name), self.manifest['format']) for name in files]
+        table = pa.concat_tables(tables) if tables else _schema().empty_table()
+        if bean_name is not None and self.manifest['partition_by'] != 'bean':
+            table = table.filter(pc.equal(table['bean_name'], bean_name))
+        return table
+
+    def training_data(self, bean_name):
+        """豆の学習データ（feature_cache.TrainingData）"""
+        count, max_id = self.manifest['beans'].get(bean_name, (0, None))
+        rows = self.read_table(bean_name).select(RECIPE_COLUMNS + DATE_FEATURE_COLUMNS).to_pandas(date_as_object=False)
+        return build_training_data(bean_name, (count, max_id), rows)
+
+
+def main():
+    from db_config import get_mysql_config
+
+    parser = argparse.ArgumentParser(description='レシピを列指向のスナップショットに書き出し')
+    parser.add_argument('--dir', default=RECIPE_SNAPSHOT_DIR, help='書き出し先のディレクトリ')
+    parser.add_argument('--partition-by', choices=['bean', 'month'], default=RECIPE_SNAPSHOT_PARTITION, help='分割方法')
+    parser.add_argument('--format', choices=sorted(FILE_EXTENSIONS), default=RECIPE_SNAPSHOT_FORMAT, help='ファイル形式')
+    parser.add_argument('--full', action='store_true', help='前回の位置を無視して全て書き出し直す')
+    args = parser.parse_args()
+
+    result = export_snapshot(get_mysql_config(), args.dir, args.partition_by, args.format, args.full)
+    print(f"スナップショットに書き出しました: {result['rows']}行, {result['files']}ファイル, "
+          f"最大ID={result['watermark']} ({result['seconds']:.1f}秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+全ての豆のモデルを一括で再学習するコマンド
+
+レシピが MIN_TRAINING_SAMPLES 件以上ある豆を一覧し、学習データを1回のクエリでまとめて取得してから、
+プロセスプールで並列に学習してモデルストアに公開する（動作中のサーバーは変更履歴の監視で自動的に反映）。
+/predict-dynamic と同じ学習処理（training.train_bean_model）を使う。
+
+--snapshot を指定すると MySQL ではなくレシピのスナップショット（recipe_snapshot.py）から学習データを読み込む。
+
+進捗は RETRAIN_PROGRESS_FILE に1豆ごとに保存し、中断後に再実行すると
+前回公開した時点からデータと学習ポリシーが変わっていない豆は学習を省略する。
+
+使い方:
+    python retrain_all.py                      # 全ての豆を学習（前回の進捗があれば続きから）
+    python retrain_all.py --workers 4          # プロセス数を指定（デフォルトはCPU数）
+    python retrain_all.py --restart            # 進捗を無視して全て学習し直す
+    python retrain_all.py --bean "豆名" ...     # 指定した豆だけ学習
+    python retrain_all.py --snapshot           # スナップショットから学習（MySQL に接続しない）
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import mysql.connector
+
+from db_config import get_mysql_config
+from feature_cache import build_training_data
+from feature_store import execute_recipe_query, materialize
+from features import MIN_TRAINING_SAMPLES
+from model_store import ModelStore
+from recipe_snapshot import RECIPE_SNAPSHOT_DIR, RecipeSnapshot
+from training import render_feature_importance, train_bean_model
+from training_policy import load_policy_overrides, policy_for_bean
+
+RETRAIN_PROGRESS_FILE = os.getenv('RETRAIN_PROGRESS_FILE', 'model/retrain_progress.json')
+
+# 学習対象の豆とデータのバージョン（feature_cache.TrainingDataCache と同じ (件数, 最大ID)）
+BEAN_LIST_QUERY = """
+SELECT b.name, COUNT(*), MAX(r.id)
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+GROUP BY b.name
+HAVING COUNT(*) >= %s
+ORDER BY b.name
+"""
+
+# 全ての豆のレシピをまとめて取得（豆ごとのクエリを繰り返さない。日付の特徴量は recipe_features から読む）
+BULK_DATA_QUERY = """
+SELECT b.name, r.gram, r.mesh, r.extraction_time, r.date, r.weather, r.temperature, r.humidity, r.days_passed,
+       {features}
+FROM recipe r
+JOIN beans b ON r.bean_id = b.id
+{join}
+"""
+
+
+def fetch_bean_versions(mysql_config, min_samples=MIN_TRAINING_SAMPLES):
+    """
+    学習対象の豆の一覧
+
+    Returns:
+        dict: 豆名 -> データのバージョン (件数, 最大ID)
+    """
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(BEAN_LIST_QUERY, (min_samples,))
+        return {name: (int(count), max_id) for name, count, max_id in cursor.fetchall()}
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def fetch_training_data(mysql_config, bean_versions):
+    """
+    対象の豆の学習データを1回のクエリで取得し、豆ごとの TrainingData に分ける
+
+    Returns:
+        dict: 豆名 -> TrainingData
+    """
+    rows_by_bean = defaultdict(list)
+    connection = mysql.connector.connect(**mysql_config)
+    cursor = connection.cursor()
+    try:
+        execute_recipe_query(cursor, BULK_DATA_QUERY)
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                if row[0] in bean_versions:
+                    rows_by_bean[row[0]].append(row[1:])
+    finally:
+        cursor.close()
+        connection.close()
+
+    return {
+        bean_name: build_training_data(bean_name, version, rows_by_bean[bean_name])
+        for bean_name, version in bean_versions.items()
+    }
+
+
+def train_and_publish_bean(bean_name, data, policy, store_root):
+    """
+    1つの豆を学習してモデルストアに公開（プロセスプールの子プロセスで実行）
+
+    Returns:
+        dict: 豆名・公開したバージョン・サンプル数・学習時間（秒）
+    """
+    started = time.perf_counter()
+    model, preprocessing_info = train_bean_model(bean_name, data, policy)
+    feature_importance = model.feature_importances_
+    version = ModelStore(store_root).publish(
+        bean_name,
+        model,
+        preprocessing_info,
+        extra_files={
+            'feature_importance.png': render_feature_importance(
+                bean_name, preprocessing_info['feature_names'], feature_importance
+            )
+        }
+    )
+    return {
+        'bean_name': bean_name,
+        'model_version': version,
+        'sample_count': data.sample_count,
+        'seconds': time.perf_counter() - started
+    }
+
+
+class RetrainProgress:
+    """豆ごとの学習結果を保存するファイル（中断後の再開用）"""
+
+    def __init__(self, path=RETRAIN_PROGRESS_FILE):
+        self.path = path
+        self.beans = {}
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.beans = json.load(f).get('beans', {})
+        except FileNotFoundError:
+            self.beans = {}
+        except ValueError:
+            print(f"⚠️ 進捗ファイルを読み込めないため最初から学習します: {self.path}")
+            self.beans = {}
+
+    def is_done(self, bean_name, data_version, policy):
+        """同じデータのバージョン・学習ポリシーで公開済みかどうか"""
+        entry = self.beans.get(bean_name)
+        return (
+            entry is not None
+            and tuple(entry['data_version']) == tuple(data_version)
+            and entry.get('training_policy') == policy.to_dict()
+        )
+
+    def record(self, bean_name, data_version, policy, result):
+        self.beans[bean_name] = {
+            'data_version': list(data_version),
+            'training_policy': policy.to_dict(),
+            'model_version': result['model_version'],
+            'sample_count': result['sample_count'],
+            'seconds': result['seconds'],
+            'finished_at': datetime.now().isoformat()
+        }
+        self.save()
+
+    def save(self):
+        """一時ファイルに書いてから置き換える（中断されても壊れない）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updated_at': datetime.now().isoformat(), 'beans': self.beans}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def retrain_all(mysql_config, workers=None, bean_names=None, restart=False,
+                store=None, progress_path=RETRAIN_PROGRESS_FILE, snapshot=None):
+    """
+    全ての豆（bean_names 指定時はその豆）を並列に学習して公開
+
+    Args:
+        snapshot: recipe_snapshot.RecipeSnapshot（指定した場合は MySQL の代わりに使う）
+
+    Returns:
+        dict: 学習結果（results / skipped / failed / wall_seconds）
+    """
+    store = store or ModelStore()
+    workers = workers or os.cpu_count() or 1
+    wall_started = time.perf_counter()
+
+    if snapshot is not None:
+        bean_versions = snapshot.bean_versions()
+    else:
+        bean_versions = fetch_bean_versions(mysql_config)
+    if bean_names:
+        missing = [name for name in bean_names if name not in bean_versions]
+        for name in missing:
+            print(f"⚠️ {name}: レシピが{MIN_TRAINING_SAMPLES}件未満か存在しないため学習しません")
+        bean_versions = {name: version for name, version in bean_versions.items() if name in bean_names}
+
+    overrides = load_policy_overrides()
+    policies = {name: policy_for_bean(name, overrides) for name in bean_versions}
+
+    progress = RetrainProgress(progress_path)
+    if not restart:
+        progress.load()
+    skipped = [name for name, version in bean_versions.items() if progress.is_done(name, version, policies[name])]
+    targets = {name: version for name, version in bean_versions.items() if name not in skipped}
+
+    print(f"学習対象: {len(targets)}個の豆（前回の進捗により省略: {len(skipped)}個）, プロセス数: {workers}")
+    if not targets:
+        return {'results': [], 'skipped': skipped, 'failed': {}, 'wall_seconds': time.perf_counter() - wall_started}
+
+    fetch_started = time.perf_counter()
+    if snapshot is not None:
+        training_data = {bean_name: snapshot.training_data(bean_name) for bean_name in targets}
+    else:
+        # 日付が編集された行の特徴量を保存し直してから読む
+        refreshed = materialize(mysql_config)
+        if refreshed:
+            print(f"日付の特徴量を保存し直しました: {refreshed}件")
+        training_data = fetch_training_data(mysql_config, targets)
+    print(f"学習データを取得しました: {sum(d.sample_count for d in training_data.values())}件 "
+          f"({time.perf_counter() - fetch_started:.1f}秒)")
+
+    results = []
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(train_and_publish_bean, bean_name, data, policies[bean_name], store.root): bean_name
+            for bean_name, data in training_data.items()
+        }
+        # 親プロセスでは学習データを保持しない
+        training_data.clear()
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            bean_name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed[bean_name] = str(e)
+                print(f"[{done}/{len(futures)}] ❌ {bean_name}: {e}")
+                continue
+            results.append(result)
+            progress.record(bean_name, targets[bean_name], policies[bean_name], result)
+            print(f"[{done}/{len(futures)}] ✅ {bean_name}: {result['sample_count']}件, "
+                  f"{result['seconds']:.1f}秒 ({result['model_version']})")
+
+    return {
+        'results': results,
+        'skipped': skipped,
+        'failed': failed,
+        'wall_seconds': time.perf_counter() - wall_started
+    }
+
+
+def print_summary(summary):
+    """豆ごとの学習時間と全体の所要時間を表示"""
+    results = sorted(summary['results'], key=lambda r: r['seconds'], reverse=True)
+
+    print("\n=== 一括再学習の結果 ===")
+    for result in results:
+        print(f"  {result['bean_name']}: {result['seconds']:.2f}秒 ({result['sample_count']}件)")
+    for bean_name, error in summary['failed'].items():
+        print(f"  {bean_name}: 失敗 ({error})")
+
+    train_seconds = sum(r['seconds'] for r in results)
+    print(f"学習: {len(results)}個, 省略: {len(summary['skipped'])}個, 失敗: {len(summary['failed'])}個")
+    print(f"学習時間の合計: {train_seconds:.1f}秒, 全体の所要時間: {summary['wall_seconds']:.1f}秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全ての豆のモデルを一括で再学習')
+    parser.add_argument('--workers', type=int, default=None, help='プロセス数（デフォルト: CPU数）')
+    parser.add_argument('--bean', action='append', dest='beans', help='学習する豆名（複数指定可）')
+    parser.add_argument('--restart', action='store_true', help='前回の進捗を無視して全て学習し直す')
+    parser.add_argument('--snapshot', nargs='?', const=RECIPE_SNAPSHOT_DIR, default=None,
+                        help='レシピのスナップショットから学習（ディレクトリ省略時: RECIPE_SNAPSHOT_DIR）')
+    args = parser.parse_args()
+
+    snapshot = RecipeSnapshot(args.snapshot) if args.snapshot else None
+    if snapshot is not None:
+        print(f"スナップショットから学習します: {args.snapshot}（最大ID={snapshot.watermark}）")
+    summary = retrain_all(get_mysql_config(), workers=args.workers, bean_names=args.beans, restart=args.restart,
+                          snapshot=snapshot)
+    print_summary(summary)
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+同じキーの処理の重複実行をまとめる（シングルフライト）
+実行中の処理と同じキーで呼ばれた場合は、新しく実行せずに実行中の処理の結果を待つ
+（同じワーカー内のみ。別のワーカーとはまとめない）
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """キーごとに実行中の処理を1つだけにする"""
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0          # 実際に実行した回数
+        self.coalesced = 0      # 実行中の処理の結果を待った回数
+
+    async def run(self, key, func, *args):
+        """
+        func(*args)（コルーチン関数）を実行し、その結果を返す
+
+        最初の呼び出し元がキャンセルされても処理は続け、待っている他の呼び出し元に結果を返す。
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._in_flight.pop(key, None)
+        # 待っている呼び出し元がいなくても例外を取り出しておく（未取得の警告を出さない）
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        """実行回数とまとめた回数"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
@@ -0,0 +1,199 @@
+"""
+起動時間の短縮（重いモジュールの遅延読み込みとウォームアップ）と起動時の import 時間の記録
+
+STARTUP_MODE:
+    eager  起動時（gunicorn ではマスタープロセスで fork 前）にモデルと重いモジュールを全て読み込んでから応答する（デフォルト）
+    lazy   /health にすぐ応答できる状態で起動し、モデルと重いモジュールはバックグラウンドのウォームアップで読み込む
+           （ウォームアップが終わるまでモデルを使うリクエストは待たせる）
+
+sklearn・pandas・matplotlib は使う関数の中で import し、どちらのモードでも
+ウォームアップ（warm_up_imports）で事前に読み込むため、最初のリクエストで読み込み（matplotlib のフォントキャッシュの作成など）が発生しない。
+
+起動時の import は python -X importtime と同じ形式（自身の時間・配下を含む時間）で記録し、
+遅い順の一覧を STARTUP_REPORT_FILE に保存する（/startup-report で確認）。
+"""
+
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'eager')
+
+# ウォームアップが終わるまでリクエストを待たせる最大秒数（超えた場合は 503）
+STARTUP_WARMUP_TIMEOUT = float(os.getenv('STARTUP_WARMUP_TIMEOUT', '60'))
+
+STARTUP_REPORT_FILE = os.getenv('STARTUP_REPORT_FILE', 'model/startup_report.json')
+
+# 起動後に使う重いモジュール（ウォームアップで読み込む）
+WARMUP_MODULES = [
+    'pandas',
+    'sklearn.ensemble',
+    'sklearn.model_selection',
+    'sklearn.metrics',
+    'sklearn.linear_model',
+    'sklearn.multioutput',
+    'matplotlib.figure',
+]
+
+# 記録を開始した時刻（プロセス起動からの経過時間の基準）
+_started = time.perf_counter()
+
+
+def is_lazy():
+    return STARTUP_MODE == 'lazy'
+
+
+class ImportTimer:
+    """
+    builtins.__import__ を置き換えて、新しく読み込まれたモジュールの import 時間を記録
+
+    importlib.import_module で直接読み込まれたモジュールは記録されないため、-X importtime より件数は少ない。
+    """
+
+    def __init__(self):
+        self.records = []               # (モジュール名, 自身の秒数, 配下を含む秒数, 深さ)
+        self._original = None
+        self._local = threading.local()
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.records.append((name, elapsed - children, elapsed, len(stack)))
+
+    def start(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def stop(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def report(self, limit=30):
+        """配下を含む時間が長い順の一覧と合計（トップレベルの import の合計）"""
+        slowest = sorted(self.records, key=lambda record: record[2], reverse=True)[:limit]
+        return {
+            'total_seconds': sum(record[2] for record in self.records if record[3] == 0),
+            'modules': [
+                {'module': name, 'self_ms': self_seconds * 1000, 'cumulative_ms': cumulative * 1000, 'depth': depth}
+                for name, self_seconds, cumulative, depth in slowest
+            ]
+        }
+
+
+def warm_up_imports():
+    """
+    重いモジュールを読み込み、matplotlib のフォントキャッシュを作成
+
+    Returns:
+        dict: モジュール名 -> 読み込みにかかった秒数
+    """
+    timings = {}
+    for name in WARMUP_MODULES:
+        started = time.perf_counter()
+        try:
+            __import__(name)
+        except ImportError as e:
+            print(f"ウォームアップで {name} を読み込めません: {e}")
+            continue
+        timings[name] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        from matplotlib import font_manager
+        font_manager.findfont('DejaVu Sans')
+        timings['matplotlib.font_manager'] = time.perf_counter() - started
+    except ImportError:
+        pass
+    return timings
+
+
+class Warmup:
+    """起動後のウォームアップ（順番に実行する処理と、その所要時間）"""
+
+    def __init__(self, steps=None):
+        self.steps = list(steps or [])  # (名前, 関数)
+        self.timings = {}
+        self.errors = {}
+        self.ready_at = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def add(self, name, func):
+        self.steps.append((name, func))
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def run(self):
+        """全ての処理を実行（失敗した処理があっても続ける）"""
+        for name, func in self.steps:
+            started = time.perf_counter()
+            try:
+                func()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"ウォームアップ「{name}」でエラー: {e}")
+            self.timings[name] = time.perf_counter() - started
+        self.ready_at = time.perf_counter() - _started
+        self._ready.set()
+        print(f"ウォームアップ完了: {self.ready_at:.2f}秒 ({', '.join(f'{k}={v:.2f}s' for k, v in self.timings.items())})")
+
+    def start(self):
+        """バックグラウンドスレッドで実行"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, name='startup-warmup', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def stats(self):
+        return {
+            "mode": STARTUP_MODE,
+            "ready": self.ready,
+            "ready_seconds": self.ready_at,
+            "steps": self.timings,
+            "errors": self.errors
+        }
+
+
+def save_report(import_timer, warmup, path=STARTUP_REPORT_FILE):
+    """起動時の import 時間とウォームアップの所要時間を保存"""
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'pid': os.getpid(),
+        'imports': import_timer.report(),
+        'warmup': warmup.stats()
+    }
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"起動レポートを保存できません: {e}")
+    return report
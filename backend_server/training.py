@@ -0,0 +1,80 @@
+"""
+豆ごとのモデルの学習
+/predict-dynamic と一括再学習で同じ学習処理を使う
+"""
+
+import io
+from datetime import datetime
+
+from features import NUMERICAL_COLUMNS, TARGET_NAMES
+from online_model import feature_statistics
+from training_policy import policy_for_bean
+
+
+def train_bean_model(bean_name, data, policy=None):
+    """
+    学習データ（feature_cache.TrainingData）から豆のモデルを学習
+
+    Args:
+        policy: 学習ポリシー（省略時は policy_for_bean で豆ごとの設定を使用）
+
+    Returns:
+        tuple: (モデル, 前処理情報)
+    """
+    from sklearn.ensemble import RandomForestRegressor
+
+    policy = policy or policy_for_bean(bean_name)
+    rows, weights = policy.select(data.dates)
+    print(f"特徴量数: {data.X.shape[1]}, サンプル数: {data.X.shape[0]}（学習に使用: {len(rows)}件）")
+
+    # RandomForest で学習（元の方式に戻す）。新しいレシピほど重みを大きくする
+    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    model.fit(data.X[rows], data.y[rows], sample_weight=weights)
+    feature_mean, feature_scale = feature_statistics(data.X[rows])
+
+    preprocessing_info = {
+        'feature_names': data.feature_names,
+        'target_names': TARGET_NAMES,
+        'categorical_columns': ['weather'],
+        'numerical_columns': NUMERICAL_COLUMNS,
+        'data_source': 'mysql_demo_db',
+        'bean_name': bean_name,
+        'training_date': datetime.now().isoformat(),
+        'sample_count': len(data.X),
+        'training_sample_count': len(rows),
+        'training_policy': policy.to_dict(),
+        # オンライン更新の補正で特徴量を標準化するための統計（online_model.py）
+        'feature_mean': feature_mean,
+        'feature_scale': feature_scale,
+        'data_version': data.version
+    }
+    return model, preprocessing_info
+
+
+def render_feature_importance(bean_name, feature_names, feature_importance):
+    """
+    特徴量重要度の棒グラフをPNGのバイト列で作成
+
+    pyplot のグローバルな状態を使わない Figure API で描画する（複数スレッドで同時に学習しても安全）
+    """
+    from matplotlib.figure import Figure
+
+    # 重要度を降順にソート
+    sorted_indices = feature_importance.argsort()[::-1]
+    sorted_features = [feature_names[i] for i in sorted_indices]
+    sorted_importance = feature_importance[sorted_indices]
+
+    # グラフを作成
+    figure = Figure(figsize=(12, 8))
+    ax = figure.subplots()
+    ax.bar(range(len(sorted_importance)), sorted_importance)
+    ax.set_xlabel('特徴量')
+    ax.set_ylabel('重要度')
+    ax.set_title(f'{bean_name} - 特徴量重要度')
+    ax.set_xticks(range(len(sorted_features)))
+    ax.set_xticklabels(sorted_features, rotation=45, ha='right')
+    figure.tight_layout()
+
+    image = io.BytesIO()
+    figure.savefig(image, format='png', dpi=300, bbox_inches='tight')
+    return image.getvalue()
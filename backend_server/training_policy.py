@@ -0,0 +1,113 @@
+"""
+学習に使うデータの範囲と重み（学習ポリシー）
+
+レシピが長期間たまった豆でも学習時間とモデルの大きさが増え続けないように、
+学習に使う行を絞り込み、新しいレシピほど大きな重み（sample_weight）を付ける。
+
+- window_days: 最新のレシピの日付からさかのぼる日数（0: 制限なし）
+- max_rows: 学習に使う最大行数（0: 制限なし）
+- sampling: 最大行数を超えた場合の選び方
+    recent      新しい順に max_rows 行
+    stratified  全期間から日付順に等間隔で max_rows 行（最新の行は必ず含める）
+- half_life_days: この日数ごとに重みを半分にする（0: 重み付けなし）
+
+デフォルトは環境変数、豆ごとの上書きは TRAINING_POLICY_FILE（JSON: 豆名 -> 上書きする項目）で指定する。
+どの条件でも MIN_TRAINING_SAMPLES 件の最新のレシピは必ず残す。
+"""
+
+import json
+import os
+
+import numpy as np
+
+from features import MIN_TRAINING_SAMPLES
+
+# 学習に使う最大行数（デフォルトは制限なし。全ての行で学習する従来の動作と同じ）
+TRAINING_MAX_ROWS = int(os.getenv('TRAINING_MAX_ROWS', '0'))
+TRAINING_WINDOW_DAYS = int(os.getenv('TRAINING_WINDOW_DAYS', '0'))
+TRAINING_SAMPLING = os.getenv('TRAINING_SAMPLING', 'recent')
+TRAINING_HALF_LIFE_DAYS = float(os.getenv('TRAINING_HALF_LIFE_DAYS', '0'))
+
+# 豆ごとの上書き（例: {"エチオピア イルガチェフェ": {"window_days": 180, "half_life_days": 60}}）
+TRAINING_POLICY_FILE = os.getenv('TRAINING_POLICY_FILE', 'model/training_policies.json')
+
+SAMPLING_METHODS = ('recent', 'stratified')
+
+
+class TrainingPolicy:
+    """1つの豆の学習ポリシー"""
+
+    def __init__(self, max_rows=TRAINING_MAX_ROWS, window_days=TRAINING_WINDOW_DAYS,
+                 sampling=TRAINING_SAMPLING, half_life_days=TRAINING_HALF_LIFE_DAYS):
+        if sampling not in SAMPLING_METHODS:
+            raise ValueError(f"sampling は {', '.join(SAMPLING_METHODS)} のいずれかを指定してください: {sampling}")
+        self.max_rows = int(max_rows)
+        self.window_days = int(window_days)
+        self.sampling = sampling
+        self.half_life_days = float(half_life_days)
+
+    def to_dict(self):
+        return {
+            'max_rows': self.max_rows,
+            'window_days': self.window_days,
+            'sampling': self.sampling,
+            'half_life_days': self.half_life_days
+        }
+
+    def select(self, dates):
+        """
+        学習に使う行と重みを決める
+
+        Args:
+            dates: 各レシピの日付 (datetime64)
+
+        Returns:
+            tuple: (使う行の位置（日付の古い順）, 各行の重み（重み付けなしの場合はNone）)
+        """
+        order = np.argsort(dates, kind='stable')
+        if len(order) == 0:
+            return order, None
+
+        # 最新のレシピからの経過日数
+        latest = dates[order[-1]]
+        age_days = (latest - dates).astype('timedelta64[s]').astype(np.float64) / 86400.0
+
+        if self.window_days > 0:
+            in_window = order[age_days[order] <= self.window_days]
+            # 期間内のレシピが少ない場合は最新の MIN_TRAINING_SAMPLES 件を残す
+            order = in_window if len(in_window) >= MIN_TRAINING_SAMPLES else order[-MIN_TRAINING_SAMPLES:]
+
+        max_rows = max(self.max_rows, MIN_TRAINING_SAMPLES) if self.max_rows > 0 else 0
+        if max_rows and len(order) > max_rows:
+            if self.sampling == 'recent':
+                order = order[-max_rows:]
+            else:
+                # 日付順に並べて等間隔に選ぶ（最初と最後を含む）
+                picks = np.unique(np.linspace(0, len(order) - 1, max_rows).round().astype(np.intp))
+                order = order[picks]
+
+        weights = None
+        if self.half_life_days > 0:
+            weights = np.power(0.5, age_days[order] / self.half_life_days)
+        return order, weights
+
+
+def load_policy_overrides(path=TRAINING_POLICY_FILE):
+    """豆ごとの上書き設定（ファイルが無ければ空）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"学習ポリシーファイルの読み込みに失敗: {e}")
+        return {}
+
+
+def policy_for_bean(bean_name, overrides=None):
+    """豆の学習ポリシー（環境変数のデフォルトに豆ごとの上書きを適用）"""
+    if overrides is None:
+        overrides = load_policy_overrides()
+    settings = TrainingPolicy().to_dict()
+    settings.update(overrides.get(bean_name, {}))
+    return TrainingPolicy(**settings)
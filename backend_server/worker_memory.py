@@ -0,0 +1,72 @@
+"""
+プロセスのメモリ使用量（Linux の /proc から取得）
+複数ワーカーでモデルのメモリページを共有できているかの確認に使う
+
+- rss: 物理メモリ上のページ（他のプロセスと共有しているページも含む）
+- pss: 共有ページを共有しているプロセス数で割った値（ワーカー数分を合計すると実際の使用量になる）
+- shared: 他のプロセスと共有しているページ
+- private: このプロセスだけのページ
+"""
+
+import os
+
+# smaps_rollup の項目名 -> 返す項目名
+SMAPS_FIELDS = {
+    'Rss': 'rss_mb',
+    'Pss': 'pss_mb',
+    'Shared_Clean': 'shared_clean_mb',
+    'Shared_Dirty': 'shared_dirty_mb',
+    'Private_Clean': 'private_clean_mb',
+    'Private_Dirty': 'private_dirty_mb',
+}
+
+
+def read_memory(pid='self'):
+    """
+    プロセスのメモリ使用量（MB）
+
+    Returns:
+        dict: rss_mb, pss_mb, shared_mb, private_mb（取得できない項目はNone）
+    """
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                field = parts[0].rstrip(':')
+                if field in SMAPS_FIELDS:
+                    values[SMAPS_FIELDS[field]] = int(parts[1]) / 1024
+    except (FileNotFoundError, PermissionError):
+        # smaps_rollup が無い環境（古いカーネル・Linux以外）は RSS だけ
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        values['rss_mb'] = int(line.split()[1]) / 1024
+        except (FileNotFoundError, PermissionError):
+            pass
+
+    shared = private = None
+    if 'shared_clean_mb' in values:
+        shared = values['shared_clean_mb'] + values['shared_dirty_mb']
+        private = values['private_clean_mb'] + values['private_dirty_mb']
+
+    return {
+        'pid': os.getpid() if pid == 'self' else int(pid),
+        'rss_mb': values.get('rss_mb'),
+        'pss_mb': values.get('pss_mb'),
+        'shared_mb': shared,
+        'private_mb': private
+    }
+
+
+def child_pids(pid):
+    """子プロセスのPID一覧（gunicorn のワーカー）"""
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(child) for child in f.read().split())
+    except FileNotFoundError:
+        pass
+    return children
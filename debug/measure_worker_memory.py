@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+複数ワーカー起動時のワーカーごとのメモリ使用量を計測するスクリプト
+
+gunicorn を PRELOAD_MODELS=true（モデルをマスターで読み込んで共有）と
+PRELOAD_MODELS=false（ワーカーごとに読み込み）で起動し、各ワーカーの RSS / PSS を比較する。
+PSS は共有ページを共有プロセス数で割った値なので、全ワーカーの PSS の合計が実際のメモリ使用量になる。
+
+使い方:
+    cd debug
+    python3 measure_worker_memory.py [ワーカー数] [リクエスト数]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend_server')
+sys.path.insert(0, BACKEND_DIR)
+
+from worker_memory import child_pids, read_memory  # noqa: E402
+
+PORT = int(os.getenv('MEASURE_PORT', '18081'))
+STARTUP_TIMEOUT = 120
+
+
+def wait_for_health(timeout=STARTUP_TIMEOUT):
+    """/health が応答するまで待つ"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{PORT}/health', timeout=2) as response:
+                return json.loads(response.read())
+        except Exception:
+            time.sleep(0.5)
+    raise TimeoutError("サーバーが起動しませんでした")
+
+
+def send_requests(count, bean_names):
+    """読み込み済みのモデルで予測して、各ワーカーがモデルのページに触れるようにする"""
+    for i in range(count):
+        if bean_names:
+            body = json.dumps({
+                'bean_name': bean_names[i % len(bean_names)],
+                'bean_origin': '',
+                'date': '2025-01-15',
+                'weather': '晴れ',
+                'temperature': 10.0,
+                'humidity': 60.0,
+                'days_passed': 14.0
+            }).encode('utf-8')
+            request = urllib.request.Request(
+                f'http://127.0.0.1:{PORT}/predict', data=body, headers={'Content-Type': 'application/json'}
+            )
+        else:
+            request = urllib.request.Request(f'http://127.0.0.1:{PORT}/health')
+        try:
+            urllib.request.urlopen(request, timeout=10).read()
+        except Exception as e:
+            print(f"  リクエストエラー: {e}")
+
+
+def measure(preload, workers, requests):
+    """gunicorn を起動してメモリ使用量を計測"""
+    env = dict(
+        os.environ,
+        PRELOAD_MODELS='true' if preload else 'false',
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(PORT),
+        DAILY_RECOMMENDATION_ENABLED='false'
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app_mysql:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        health = wait_for_health()
+        # 全ワーカーの起動を待つ
+        deadline = time.time() + STARTUP_TIMEOUT
+        while len(child_pids(process.pid)) < workers and time.time() < deadline:
+            time.sleep(0.5)
+        send_requests(requests, health.get('available_saved_models', []))
+        time.sleep(1)
+
+        master = read_memory(process.pid)
+        worker_memory = [read_memory(pid) for pid in child_pids(process.pid)]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return health, master, worker_memory
+
+
+def format_mb(value):
+    return '-' if value is None else f"{value:8.1f}"
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    results = {}
+    for preload in (True, False):
+        label = '共有あり (PRELOAD_MODELS=true)' if preload else '共有なし (PRELOAD_MODELS=false)'
+        print(f"=== {label}, ワーカー数={workers} ===")
+        health, master, worker_memory = measure(preload, workers, requests)
+        print(f"読み込み済みモデル: {health.get('saved_models_loaded')}個")
+        print(f"{'pid':>8} {'RSS(MB)':>8} {'PSS(MB)':>8} {'共有(MB)':>8} {'専有(MB)':>8}")
+        for name, memory in [('master', master)] + [('worker', m) for m in worker_memory]:
+            print(f"{memory['pid']:>8} {format_mb(memory['rss_mb'])} {format_mb(memory['pss_mb'])} "
+                  f"{format_mb(memory['shared_mb'])} {format_mb(memory['private_mb'])}  {name}")
+        total_pss = sum((m['pss_mb'] or 0) for m in [master] + worker_memory)
+        print(f"PSS合計: {total_pss:.1f}MB")
+        print()
+        results[preload] = total_pss
+
+    if results[False] > 0:
+        print(f"✅ 共有による削減: {results[False] - results[True]:.1f}MB "
+              f"({(1 - results[True] / results[False]) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+起動してから最初に /health が応答するまでの時間が予算内かを確認するスクリプト
+
+gunicorn を STARTUP_MODE（デフォルト: lazy）で起動し、プロセスの起動から /health が 200 を返すまでの秒数を計測する。
+STARTUP_BUDGET_SECONDS を超えた場合は終了コード 1 で終了する（CI などで起動時間の悪化を検出する用）。
+あわせて、ウォームアップが終わるまでの秒数と /startup-report の遅い import を表示する。
+
+使い方:
+    cd debug
+    python3 test_startup_budget.py [予算（秒）]
+    STARTUP_MODE=eager python3 test_startup_budget.py 10
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend_server')
+
+PORT = int(os.getenv('MEASURE_PORT', '18082'))
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'lazy')
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', '3'))
+STARTUP_TIMEOUT = 120
+
+
+def get_json(path):
+    with urllib.request.urlopen(f'http://127.0.0.1:{PORT}{path}', timeout=2) as response:
+        return json.loads(response.read())
+
+
+def wait_for(condition, started, timeout=STARTUP_TIMEOUT):
+    """condition(/health の結果) が真になるまで待ち、起動からの秒数を返す"""
+    while time.perf_counter() - started < timeout:
+        try:
+            if condition(get_json('/health')):
+                return time.perf_counter() - started
+        except Exception:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError("サーバーが起動しませんでした")
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET_SECONDS
+    env = dict(
+        os.environ,
+        STARTUP_MODE=STARTUP_MODE,
+        WEB_CONCURRENCY='1',
+        PORT=str(PORT),
+        DAILY_RECOMMENDATION_ENABLED='false',
+        CHANGE_POLLER_ENABLED='false'
+    )
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app_mysql:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        health_seconds = wait_for(lambda health: True, started)
+        ready_seconds = wait_for(lambda health: health.get('startup', {}).get('ready'), started)
+        report = get_json('/startup-report')
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    print(f"=== 起動時間 (STARTUP_MODE={STARTUP_MODE}) ===")
+    print(f"最初の /health まで: {health_seconds:.2f}秒 (予算: {budget:.2f}秒)")
+    print(f"ウォームアップ完了まで: {ready_seconds:.2f}秒")
+    for name, seconds in report['warmup']['steps'].items():
+        print(f"  {name}: {seconds:.2f}秒")
+    print(f"起動時の import: {report['imports']['total_seconds']:.2f}秒（遅い順）")
+    for module in report['imports']['modules'][:10]:
+        print(f"  {module['cumulative_ms']:8.1f}ms  {module['module']}")
+
+    if health_seconds > budget:
+        print(f"❌ 最初の /health までの時間が予算を超えました: {health_seconds:.2f}秒 > {budget:.2f}秒")
+        sys.exit(1)
+    print("✅ 予算内に起動しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ FLUSH PRIVILEGES;
 USE demo_db;
 
 -- テーブルが存在しない場合は作成（Spring BootのJPAが自動生成するため、ここでは作成しない）
+-- インデックスはテーブル作成後に backend_server/migrate_schema.py で作成する（insert_data.py から自動実行）
 -- 必要に応じて初期データを挿入
 
 